@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for the image server.
+
+Usage:
+    uv run --with gunicorn gunicorn -c gunicorn.conf.py image_server:app
+"""
+
+bind = "0.0.0.0:5000"
+
+# A single worker process: rotation state, the in-memory image cache and the
+# prepack thread live in the process, so a second worker would advance
+# rotations and write the state file independently. Concurrency comes from
+# threads instead (the dither kernels and Pillow release the GIL).
+workers = 1
+worker_class = "gthread"
+threads = 8
+
+# Serving the 960KB buffer to a device on a weak Wi-Fi link can take a while
+timeout = 120
+
+
+def post_worker_init(worker):
+    """Print the startup info and start the background workers in the serving process."""
+    import image_server
+    image_server.print_startup_info()
+    image_server.start_background_workers()
@@ -7,7 +7,7 @@ The ESP32 firmware fetches from /image_packed to get display-ready data.
 
 Endpoints:
     /image_packed - Returns 960KB packed binary (4bpp, 1600x1200)
-    /hash - Returns 16-char MD5 hash for change detection
+    /hash - Returns 16-char content hash for change detection
     /image - Returns transformed JPEG for preview
     /imagejpg - Returns random front page image
 
@@ -16,28 +16,71 @@ Usage:
     # Server runs on http://0.0.0.0:5000
 """
 
-from flask import Flask, send_file, Response, jsonify, request, redirect, g, has_request_context
+from flask import (Flask, send_file, Response, jsonify, request, redirect, g, has_request_context,
+                   render_template, get_template_attribute)
+from flask.json.provider import DefaultJSONProvider
+import numpy as np
 import requests
-import wand.image
+import io
 from io import BytesIO
 import random
+import secrets
 import os
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import atexit
+from collections import OrderedDict
 import hashlib
+import gzip
 import json
+import math
 import logging
+import logging.handlers
+import sys
+import tempfile
 import time
 from datetime import datetime
-from html import escape
 from urllib.parse import quote_plus
 
 # Try to import PIL for image processing
 try:
-    from PIL import Image, ImageOps, ImageEnhance
+    from PIL import Image, ImageOps, features as pil_features, __version__ as PIL_VERSION
     PIL_AVAILABLE = True
 except ImportError:
     PIL_AVAILABLE = False
     print("Warning: PIL not available. /image_packed endpoint will not work.")
 
+# Try to import numba for the JIT-compiled dithering kernel
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("Warning: numba not installed. Falling back to PIL dithering.")
+
+# Try to import pyvips (libvips) for faster decode + resize; Pillow is used without it
+try:
+    import pyvips
+    PYVIPS_AVAILABLE = True
+except (ImportError, OSError):  # OSError: binding installed but libvips missing
+    PYVIPS_AVAILABLE = False
+
+# Try to import orjson for faster JSON responses; Flask's stdlib encoder is used without it
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Try to import blake3 (SIMD) for hashing packed images; hashlib's BLAKE2b is used without it
+try:
+    from blake3 import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
 # Try to import pillow-heif for HEIC support
 try:
     import pillow_heif
@@ -55,15 +98,35 @@ except ImportError:
 
 app = Flask(__name__)
 
+if ORJSON_AVAILABLE:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson (compact output, sorted keys like Flask's)."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+
 user_agent = "Mozilla/5.0 (Wayland; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 headers = {'User-Agent': user_agent}
 
+# Shared session so repeat /imagejpg fetches reuse keep-alive connections
+# instead of paying a TCP+TLS handshake each time
+http_session = requests.Session()
+http_session.headers.update(headers)
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
 # Display configuration
 # Note: Buffer is 1600x1200 to match firmware expectations
 # Image is rotated 90° CCW for portrait-mounted display
 FRAME_WIDTH = 1600
 FRAME_HEIGHT = 1200
 BUFFER_SIZE = 960000  # (1600 * 1200) / 2 bytes
+EXIF_ORIENTATION_TAG = 0x0112  # 1 = normal, 2-8 = flipped and/or rotated
+JPEG_MAGIC = b'\xff\xd8\xff'  # Start of every JPEG file (SOI marker + next marker)
 
 # The Spectra 6 Color Palette (RGB)
 PALETTE_RGB = [
@@ -85,6 +148,73 @@ HARDWARE_MAP = {
     5: 0x06   # Green
 }
 
+def srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    """Convert sRGB values in 0-255 to linear light in 0.0-1.0."""
+    c = np.asarray(values, dtype=np.float64) / 255.0
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+
+def linear_to_srgb(values: np.ndarray) -> np.ndarray:
+    """Convert linear light in 0.0-1.0 to sRGB values in 0-255."""
+    c = np.clip(np.asarray(values, dtype=np.float64), 0.0, 1.0)
+    srgb = np.where(c <= 0.0031308, c * 12.92, 1.055 * c ** (1 / 2.4) - 0.055)
+    return np.rint(srgb * 255.0).astype(np.uint8)
+
+
+def build_nearest_lut(palette_rgb) -> np.ndarray:
+    """
+    Map every 5-bit-per-channel sRGB value (32768 entries) to its nearest palette index.
+
+    Distances are measured in linear light so the match agrees with the
+    linear-space error diffusion in the dither kernel.
+    """
+    levels = srgb_to_linear(np.arange(32) * 8 + 4)  # Center of each 5-bit bucket
+    r, g, b = np.meshgrid(levels, levels, levels, indexing='ij')
+    centers = np.stack([r, g, b], axis=-1).reshape(-1, 3)
+    palette = srgb_to_linear(palette_rgb)
+    distances = ((centers[:, None, :] - palette[None, :, :]) ** 2).sum(axis=-1)
+    return distances.argmin(axis=1).astype(np.uint8)
+
+
+# Dithering works in linear light: sRGB input is linearized through a 256-entry
+# table, and diffused values are mapped back to sRGB only to index NEAREST_LUT
+LINEAR_LUT_SIZE = 16384
+SRGB_TO_LINEAR = srgb_to_linear(np.arange(256))
+LINEAR_TO_SRGB = linear_to_srgb(np.arange(LINEAR_LUT_SIZE) / (LINEAR_LUT_SIZE - 1))
+PALETTE_LINEAR = srgb_to_linear(PALETTE_RGB)
+
+# 8-bit linear-light encoding of each sRGB level, so the PIL fallback can
+# quantize and diffuse error in linear light too
+SRGB_TO_LINEAR8 = np.rint(SRGB_TO_LINEAR * 255.0).astype(np.uint8)
+
+# Nearest palette index for each quantized sRGB value, indexed by (r>>3)<<10 | (g>>3)<<5 | (b>>3)
+NEAREST_LUT = build_nearest_lut(PALETTE_RGB)
+
+def build_bayer_matrix(size: int) -> np.ndarray:
+    """Return a size x size Bayer threshold matrix with values in (0, 1), size a power of 2."""
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                           [4 * matrix + 3, 4 * matrix + 1]])
+    return ((matrix + 0.5) / matrix.size).astype(np.float32)
+
+
+BAYER_8X8 = build_bayer_matrix(8)
+
+# Hardware code for each palette index, as a flat table instead of a dict lookup
+HARDWARE_CODES = bytes(HARDWARE_MAP[i] for i in range(len(PALETTE_RGB)))
+HARDWARE_CODES_ARRAY = np.frombuffer(HARDWARE_CODES, dtype=np.uint8)
+
+# 256-entry lookup table from palette index to hardware code (unknown -> White)
+HARDWARE_LUT = np.full(256, 0x01, dtype=np.uint8)
+HARDWARE_LUT[:len(HARDWARE_CODES)] = HARDWARE_CODES_ARRAY
+
+# 65536-entry lookup table from a pair of palette indices, read as a
+# little-endian uint16 (first pixel in the low byte), to the packed byte
+_pairs = np.arange(65536)
+PAIR_PACK_LUT = ((HARDWARE_LUT[_pairs & 0xFF] << 4) | HARDWARE_LUT[_pairs >> 8]).astype(np.uint8)
+del _pairs
+
 # Image to display - change this path to your desired image
 DEFAULT_IMAGE_PATH = "image.jpg"
 
@@ -92,6 +222,13 @@ DEFAULT_IMAGE_PATH = "image.jpg"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGES_DIR = os.path.join(SCRIPT_DIR, "images")
 STATE_FILE = os.path.join(SCRIPT_DIR, ".eink_rotation_state.json")
+STATE_SAVE_DELAY_SECONDS = 2  # Rotation state writes are batched over this window
+# Directory listings are only cached once the directory's mtime is this old:
+# a file added within the same timestamp tick as a scan would not change it
+DIR_MTIME_SETTLE_SECONDS = 2
+PACKED_CACHE_DIR = os.path.join(SCRIPT_DIR, ".packed_cache")
+PACKED_CACHE_VERSION = 5  # Bump when the processing pipeline or cache format changes
+HASH_ALGO = 'blake3' if BLAKE3_AVAILABLE else 'blake2b'  # Recorded in the disk cache sidecar
 DEVICE_CONFIG_FILENAME = "device_config.json"
 GLOBAL_DEVICE_CONFIG_PATH = os.path.join(SCRIPT_DIR, DEVICE_CONFIG_FILENAME)
 SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.heic', '.webp'}
@@ -104,39 +241,137 @@ SCHEDULE_KEYS = (
     'timezone_offset_minutes',
 )
 
+# gzip level for the compressed /image_packed variant (dithered data compresses ~3x)
+PACKED_GZIP_LEVEL = 6
+
+# How often the background worker pre-processes each device's pending image
+PREPACK_INTERVAL_SECONDS = 30
+# Worker processes for prepacking a backlog of gallery images (one core is
+# left for serving requests); 1 processes the backlog on the prepack thread
+PREPACK_PROCESSES = max(1, (os.cpu_count() or 1) - 1)
+# Longest a request waits for a prepack process to finish its image before
+# processing it itself (a queued image may not be started for minutes)
+PREPACK_WAIT_SECONDS = 5
+# True in those worker processes: spawn re-imports this module there only to
+# run _prepack_in_subprocess, so the serving-process setup (rotation state,
+# its writer thread, the log listener) is skipped. The process name is set
+# before spawn imports the main module; parent_process() is not set until after.
+_IN_PREPACK_PROCESS = multiprocessing.current_process().name != "MainProcess"
+
+# Resized front pages kept ready for /imagejpg by a background thread; older
+# ones are dropped since the front pages change daily
+FRONTPAGE_PREFETCH_COUNT = 2
+FRONTPAGE_MAX_AGE_SECONDS = 3600
+FRONTPAGE_RETRY_SECONDS = 30  # Wait after a failed fetch before trying again
+
 # Image enhancement settings
 DEFAULT_CONTRAST = 1.2
 DEFAULT_BRIGHTNESS = 1.0
 DEFAULT_SATURATION = 1.2
 
-# Cache for processed image data
-_image_cache = {
-    'data': None,
-    'hash': None,
-    'source_path': None,   # Path to the source image
-    'source_mtime': None,  # Modification time of source image
+# Dithering: "floyd-steinberg" (error diffusion, best quality) or "ordered"
+# (8x8 Bayer threshold, faster and parallel but with a visible pattern and
+# weaker color mixing). "ordered" needs Numba; without it Floyd-Steinberg is used.
+DITHER_MODE = "floyd-steinberg"
+ORDERED_DITHER_STRENGTH = 0.75  # Threshold spread in linear light (0.0-1.0)
+
+# Processed images kept in memory (~1MB each, ~1.3MB once gzip-encoded too),
+# so a rotation cycling through the gallery is served without reprocessing
+IMAGE_CACHE_MAX_ENTRIES = 16
+
+# LRU cache of processed image data, keyed by the source's (st_dev, st_ino). Entries:
+#   'data':       packed 4bpp buffer
+#   'hash':       16-char change-detection hash
+#   'gzip':       gzip-compressed copy of data, made on the first gzip request
+#   'source_sig': (mtime_ns, size) of the source image
+_image_cache: OrderedDict[tuple, dict] = OrderedDict()
+
+# Guards the LRU bookkeeping in _image_cache (held only for dict operations)
+_image_cache_lock = threading.Lock()
+
+# One lock per source (st_dev, st_ino): concurrent requests for a freshly
+# changed image process it once instead of each running the full
+# quantize+dither, while misses for different images run in parallel.
+# Grows by one small lock per distinct image seen.
+_source_locks = {}
+_source_locks_lock = threading.Lock()
+
+# Sources submitted to prepack worker processes: {source_key: Event set when done}.
+# Those processes can't take _source_lock, so request threads wait on the
+# event (up to PREPACK_WAIT_SECONDS) rather than processing the same image
+# in parallel.
+# Written only by the prepack thread.
+_prepack_in_flight = {}
+
+# (source_key, source_sig) pairs the last gallery scan found in the disk cache,
+# so the next scan only stats those images instead of rereading their sidecars.
+# Used only by the prepack thread.
+_prepack_verified = set()
+
+# Rendered /image preview JPEG, rebuilt only when image.jpg changes
+_preview_cache = {
+    'sig': None,    # stat_source_image() of image.jpg when the blob was built
+    'blob': None,
 }
 
 
+# Prefetched /imagejpg JPEGs as (fetched_at, blob); the prefetch thread is
+# started by the first /imagejpg request
+_frontpage_queue = queue.Queue(maxsize=FRONTPAGE_PREFETCH_COUNT)
+_frontpage_prefetch_lock = threading.Lock()
+_frontpage_prefetch_thread = None
+
+# Parsed schedule config files: {path: ((mtime_ns, size), config or None)}
+_schedule_config_cache = {}
+
+# Rendered status page schedule cards: {(target, redirect_to): (signature, html)}
+_schedule_card_cache = {}
+
+# One-shot messages for the page a schedule form redirects to: {token: (message, created)}
+FLASH_MAX_AGE_SECONDS = 60
+_flash_messages = {}
+_flash_lock = threading.Lock()
+
+
 def normalize_mac(mac_str: str) -> str:
     """Convert MAC address to lowercase, no separators."""
     return mac_str.lower().replace(':', '').replace('-', '').replace(' ', '')
 
 
 def load_schedule_config(path: str) -> dict | None:
-    """Load and validate an optional schedule config JSON file."""
-    if not os.path.exists(path):
+    """
+    Load and validate an optional schedule config JSON file.
+
+    Parsed configs are cached per path and reused while the file's
+    (mtime_ns, size) is unchanged, so repeated lookups cost one stat.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
         return None
 
+    sig = (st.st_mtime_ns, st.st_size)
+    cached = _schedule_config_cache.get(path)
+    if cached and cached[0] == sig:
+        config = cached[1]
+    else:
+        config = _parse_schedule_config(path)
+        _schedule_config_cache[path] = (sig, config)
+    # Copy so callers can't modify the cached config
+    return dict(config) if config is not None else None
+
+
+def _parse_schedule_config(path: str) -> dict | None:
+    """Read and validate a schedule config JSON file."""
     try:
         with open(path, 'r') as f:
             raw = json.load(f)
     except (OSError, json.JSONDecodeError) as e:
-        print(f"Error loading device config {path}: {e}")
+        log_message(f"Error loading device config {path}: {e}")
         return None
 
     if not isinstance(raw, dict):
-        print(f"Device config {path} must contain a JSON object")
+        log_message(f"Device config {path} must contain a JSON object")
         return None
 
     config = {}
@@ -146,28 +381,28 @@ def load_schedule_config(path: str) -> dict | None:
         if isinstance(value, int) and 0 <= value <= 23:
             config['active_start_hour'] = value
         else:
-            print(f"Ignoring invalid active_start_hour in {path}: {value}")
+            log_message(f"Ignoring invalid active_start_hour in {path}: {value}")
 
     if 'active_end_hour' in raw:
         value = raw['active_end_hour']
         if isinstance(value, int) and 0 <= value <= 23:
             config['active_end_hour'] = value
         else:
-            print(f"Ignoring invalid active_end_hour in {path}: {value}")
+            log_message(f"Ignoring invalid active_end_hour in {path}: {value}")
 
     if 'timezone_offset_minutes' in raw:
         value = raw['timezone_offset_minutes']
         if isinstance(value, int) and -720 <= value <= 840:
             config['timezone_offset_minutes'] = value
         else:
-            print(f"Ignoring invalid timezone_offset_minutes in {path}: {value}")
+            log_message(f"Ignoring invalid timezone_offset_minutes in {path}: {value}")
 
     if 'refresh_interval_minutes' in raw:
         value = raw['refresh_interval_minutes']
         if isinstance(value, int) and 1 <= value <= 1440:
             config['refresh_interval_minutes'] = value
         else:
-            print(f"Ignoring invalid refresh_interval_minutes in {path}: {value}")
+            log_message(f"Ignoring invalid refresh_interval_minutes in {path}: {value}")
 
     return config
 
@@ -312,128 +547,99 @@ def get_schedule_targets() -> list[str]:
 
 def render_schedule_form_card(target: str, include_target_picker: bool = False,
                               redirect_to: str = "/schedule") -> str:
-    """Render a schedule override form card for a specific target."""
-    state = get_schedule_editor_state(target)
-    exact_json = escape(json.dumps(state['exact_config'], indent=2)) if state['exact_config'] else '{}'
-    effective_json = escape(json.dumps(state['effective_config'], indent=2)) if state['effective_config'] else '{}'
-    network_info_html = ""
-
-    if target not in {GLOBAL_SCHEDULE_TARGET, DEFAULT_DEVICE_ID}:
-        network_info = _device_network_status.get(target)
-        if network_info:
-            network_info_html = (
-                f'<p><strong>Last IP:</strong> <code>{escape(network_info["ip"])}</code><br>'
-                f'<span class="hint">Last seen: {escape(network_info["timestamp"])}</span></p>'
-            )
-        else:
-            network_info_html = '<p><strong>Last IP:</strong> <span class="hint">Not seen yet</span></p>'
-
-    target_picker_html = ""
-    if include_target_picker:
-        target_picker_html = f"""
-        <form action="/schedule" method="GET" style="margin-top: 12px;">
-          <div class="row">
-            <label for="target">Edit target</label>
-            <input id="target" type="text" name="target" value="{escape(state['target'])}" placeholder="global, default, or device MAC">
-            <div class="hint">Use <code>global</code>, <code>default</code>, or a MAC like <code>d0cf1326f7e8</code>.</div>
-          </div>
-          <button type="submit">Open Target</button>
-        </form>
-        """
+    """
+    Render a schedule override form card for a specific target.
 
-    return f"""
-      <div class="card">
-        <h2>{escape(state['label'])}</h2>
-        <p><strong>Override file:</strong> <code>{escape(state['exact_path'])}</code></p>
-        <p><strong>Effective source:</strong> <code>{escape(state['effective_source'])}</code></p>
-        {network_info_html}
-        {target_picker_html}
-        <form action="/schedule/save" method="POST">
-          <input type="hidden" name="target" value="{escape(state['target'])}">
-          <input type="hidden" name="redirect_to" value="{escape(redirect_to)}">
-          <div class="row">
-            <label>Refresh Interval (minutes)</label>
-            <input type="number" name="refresh_interval_minutes" min="1" max="1440" value="{escape(str(state['form_values']['refresh_interval_minutes']))}" required>
-          </div>
-          <div class="row">
-            <label>Active Start Hour</label>
-            <input type="number" name="active_start_hour" min="0" max="23" value="{escape(str(state['form_values']['active_start_hour']))}" required>
-          </div>
-          <div class="row">
-            <label>Active End Hour</label>
-            <input type="number" name="active_end_hour" min="0" max="23" value="{escape(str(state['form_values']['active_end_hour']))}" required>
-          </div>
-          <div class="row">
-            <label>Timezone Offset (minutes from UTC)</label>
-            <input type="number" name="timezone_offset_minutes" min="-720" max="840" value="{escape(str(state['form_values']['timezone_offset_minutes']))}" required>
-          </div>
-          <button type="submit">Save Override</button>
-        </form>
-        <form action="/schedule/clear" method="POST" style="margin-top:12px;">
-          <input type="hidden" name="target" value="{escape(state['target'])}">
-          <input type="hidden" name="redirect_to" value="{escape(redirect_to)}">
-          <button type="submit" class="danger">Clear Override</button>
-          <span class="hint">Deletes only the exact file for this target.</span>
-        </form>
-        <div style="margin-top:16px;">
-          <strong>Exact Override JSON</strong>
-          <pre>{exact_json}</pre>
-          <strong>Effective Schedule JSON</strong>
-          <pre>{effective_json}</pre>
-        </div>
-      </div>
+    Cards without the target picker (the ones on the status page, one per
+    known device) are cached and only re-rendered when their inputs change:
+    the schedule configs (already cached by file signature) or the device's
+    last IP and timestamp.
     """
+    state = get_schedule_editor_state(target)
+    network_info = _device_network_status.get(state['target'])
+
+    cache_key = None
+    if not include_target_picker:
+        cache_key = (state['target'], redirect_to)
+        signature = (
+            tuple(sorted(state['exact_config'].items())),
+            tuple(sorted(state['effective_config'].items())),
+            state['effective_source'],
+            state['has_override'],
+            tuple(sorted(network_info.items())) if network_info else None,
+        )
+        cached = _schedule_card_cache.get(cache_key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    exact_json = json.dumps(state['exact_config'], indent=2) if state['exact_config'] else '{}'
+    effective_json = json.dumps(state['effective_config'], indent=2) if state['effective_config'] else '{}'
+
+    # Jinja compiles the template once and autoescapes every value
+    schedule_form_card = get_template_attribute('schedule_form_card.html', 'schedule_form_card')
+    html = schedule_form_card(
+        state,
+        exact_json,
+        effective_json,
+        show_network_info=target not in {GLOBAL_SCHEDULE_TARGET, DEFAULT_DEVICE_ID},
+        network_info=network_info,
+        include_target_picker=include_target_picker,
+        redirect_to=redirect_to,
+    )
+    if cache_key is not None:
+        _schedule_card_cache[cache_key] = (signature, html)
+    return html
+
+
+def stash_flash(message: str) -> str:
+    """Store a message for the next page view and return its token."""
+    token = secrets.token_urlsafe(8)
+    now = time.monotonic()
+    with _flash_lock:
+        for key, (_, created) in list(_flash_messages.items()):
+            if now - created > FLASH_MAX_AGE_SECONDS:
+                del _flash_messages[key]
+        _flash_messages[token] = (message, now)
+    return token
+
+
+def pop_flash(token: str | None) -> str:
+    """Return and forget the message stored under token, or '' if unknown or expired."""
+    if not token:
+        return ""
+    with _flash_lock:
+        entry = _flash_messages.pop(token, None)
+    if entry is None or time.monotonic() - entry[1] > FLASH_MAX_AGE_SECONDS:
+        return ""
+    return entry[0]
+
+
+def redirect_with_flash(redirect_to: str, target: str, message: str) -> Response:
+    """Redirect back to the status page or schedule editor with a one-shot message."""
+    token = stash_flash(message)
+    if redirect_to == '/':
+        return redirect(f"/?flash={token}")
+    return redirect(f"/schedule?target={quote_plus(target)}&flash={token}")
 
 
 def render_schedule_editor(target: str, message: str = "", error: str = "") -> str:
     """Render a simple HTML editor for schedule overrides."""
-    shortcuts = ''.join(
-        f'<li><a href="/schedule?target={escape(schedule_target)}">{escape(describe_schedule_target(schedule_target))}</a></li>'
+    shortcuts = [
+        (schedule_target, describe_schedule_target(schedule_target))
         for schedule_target in get_schedule_targets()
+    ]
+    return render_template(
+        'schedule_editor.html',
+        message=message,
+        error=error,
+        form_card=render_schedule_form_card(target, include_target_picker=True),
+        shortcuts=shortcuts,
     )
-    message_html = f'<div class="message success">{escape(message)}</div>' if message else ''
-    error_html = f'<div class="message error">{escape(error)}</div>' if error else ''
-
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-      <meta name="viewport" content="width=device-width, initial-scale=1">
-      <title>Schedule Editor</title>
-      <style>
-        body {{ font-family: Arial, sans-serif; max-width: 720px; margin: 32px auto; padding: 0 16px 48px; background: #f6f7f9; color: #222; }}
-        h1, h2 {{ margin-bottom: 0.4rem; }}
-        .card {{ background: white; border: 1px solid #ddd; border-radius: 8px; padding: 18px; margin-bottom: 16px; }}
-        .row {{ margin-bottom: 14px; }}
-        label {{ display: block; font-weight: bold; margin-bottom: 6px; }}
-        input[type="text"], input[type="number"] {{ width: 100%; box-sizing: border-box; padding: 10px; border: 1px solid #ccc; border-radius: 4px; }}
-        button {{ background: #0b67d0; color: white; border: none; padding: 10px 16px; border-radius: 4px; cursor: pointer; margin-right: 8px; }}
-        button.danger {{ background: #c43d31; }}
-        .message {{ padding: 12px 14px; border-radius: 6px; margin-bottom: 16px; }}
-        .success {{ background: #e7f6ea; border: 1px solid #9bd0a7; }}
-        .error {{ background: #fdecec; border: 1px solid #e2a4a4; }}
-        code, pre {{ background: #eef1f4; border-radius: 4px; }}
-        code {{ padding: 2px 5px; }}
-        pre {{ padding: 12px; overflow-x: auto; }}
-        ul {{ margin-top: 8px; }}
-        .hint {{ color: #555; font-size: 0.95em; }}
-      </style>
-    </head>
-    <body>
-      <h1>Schedule Editor</h1>
-      <p><a href="/">Back to server status</a></p>
-      {message_html}
-      {error_html}
-
-      {render_schedule_form_card(target, include_target_picker=True)}
-
-      <div class="card">
-        <h2>Shortcuts</h2>
-        <ul>{shortcuts}</ul>
-      </div>
-    </body>
-    </html>
-    """
+
+
+def mtime_is_settled(mtime_ns: int) -> bool:
+    """True if a directory mtime is old enough to key a cached listing on."""
+    return time.time_ns() - mtime_ns > DIR_MTIME_SETTLE_SECONDS * 1_000_000_000
 
 
 class ImageRotator:
@@ -443,8 +649,16 @@ class ImageRotator:
         self.images_dir = images_dir
         self.state_file = state_file
         self._device_states = {}  # Per-device state: {device_id: {current_index, last_returned}}
+        self._scan_cache = {}  # Directory listings: {device_dir: (dir_mtime_ns, images)}
+        self._device_dir_cache = {}  # Resolved dirs: {device_id: (images_dir_mtime_ns, device_dir)}
+        self._state_dirty = threading.Event()
+        self._flush_lock = threading.Lock()
         self._load_state()
 
+        # State is written by a background thread so requests never wait on disk
+        threading.Thread(target=self._state_writer, name="state-writer", daemon=True).start()
+        atexit.register(self.flush_state)
+
     def _load_state(self):
         """Load rotation state from JSON file (per-device format)."""
         if os.path.exists(self.state_file):
@@ -454,7 +668,7 @@ class ImageRotator:
                 # Check if it's the old single-device format and migrate
                 if 'current_index' in state and 'last_returned' in state:
                     # Old format - migrate to new per-device format under 'default'
-                    print("Migrating old state file format to per-device format")
+                    log_message("Migrating old state file format to per-device format")
                     self._device_states = {
                         DEFAULT_DEVICE_ID: {
                             'current_index': state.get('current_index', 0),
@@ -465,20 +679,41 @@ class ImageRotator:
                 else:
                     # New per-device format
                     self._device_states = state
-                print(f"Loaded rotation state for {len(self._device_states)} device(s)")
+                log_message(f"Loaded rotation state for {len(self._device_states)} device(s)")
             except (json.JSONDecodeError, IOError) as e:
-                print(f"Error loading state file: {e}")
+                log_message(f"Error loading state file: {e}")
                 self._device_states = {}
         else:
             self._device_states = {}
 
     def _save_state(self):
-        """Save rotation state to JSON file (per-device format)."""
-        try:
-            with open(self.state_file, 'w') as f:
-                json.dump(self._device_states, f, indent=2)
-        except IOError as e:
-            print(f"Error saving state file: {e}")
+        """Schedule a save of the rotation state (written by the state writer thread)."""
+        self._state_dirty.set()
+
+    def _state_writer(self):
+        """Background loop that batches state saves into one write per delay window."""
+        while True:
+            self._state_dirty.wait()
+            time.sleep(STATE_SAVE_DELAY_SECONDS)
+            self.flush_state()
+
+    def flush_state(self):
+        """Write rotation state to the JSON file now if it has unsaved changes."""
+        with self._flush_lock:
+            if not self._state_dirty.is_set():
+                return
+            self._state_dirty.clear()
+
+            # Snapshot so request threads can keep updating while we serialize
+            state = {device_id: dict(device_state)
+                     for device_id, device_state in list(self._device_states.items())}
+            tmp_path = self.state_file + '.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(json.dumps(state, separators=(',', ':')))
+                os.replace(tmp_path, self.state_file)
+            except OSError as e:
+                log_message(f"Error saving state file: {e}")
 
     def _get_device_state(self, device_id: str) -> dict:
         """Get or create state for a specific device."""
@@ -494,7 +729,26 @@ class ImageRotator:
         Get the images directory for a specific device.
 
         Falls back to 'default' directory if device-specific directory doesn't exist.
+        The result is cached per device while the images directory's mtime is
+        unchanged (creating, removing or renaming a device directory bumps it)
+        and settled (see mtime_is_settled).
         """
+        try:
+            images_mtime = os.stat(self.images_dir).st_mtime_ns
+        except OSError:
+            return self.images_dir
+
+        cached = self._device_dir_cache.get(device_id)
+        if cached and cached[0] == images_mtime:
+            return cached[1]
+
+        device_dir = self._resolve_device_dir(device_id)
+        if mtime_is_settled(images_mtime):
+            self._device_dir_cache[device_id] = (images_mtime, device_dir)
+        return device_dir
+
+    def _resolve_device_dir(self, device_id: str) -> str:
+        """Pick the device's own directory, else 'default', else the base images directory."""
         device_dir = os.path.join(self.images_dir, device_id)
         if os.path.isdir(device_dir):
             return device_dir
@@ -508,36 +762,59 @@ class ImageRotator:
         return self.images_dir
 
     def _scan_directory(self, device_id: str) -> list[str]:
-        """Scan directory and return sorted list of image filenames."""
-        device_dir = self._get_device_dir(device_id)
-        if not os.path.isdir(device_dir):
+        """Scan a device's directory and return sorted list of image filenames."""
+        return self._list_images(self._get_device_dir(device_id))
+
+    def _list_images(self, device_dir: str) -> list[str]:
+        """
+        Return the sorted image filenames in a directory.
+
+        The listing is cached per directory and reused while the directory's
+        mtime is unchanged (adding, removing or renaming files bumps it), so
+        repeated polls cost one stat instead of a full scan. A directory
+        modified in the last DIR_MTIME_SETTLE_SECONDS is rescanned every time,
+        since a change within the same mtime tick would go unnoticed.
+        """
+        try:
+            dir_mtime = os.stat(device_dir).st_mtime_ns
+        except OSError:
             return []
 
+        cached = self._scan_cache.get(device_dir)
+        if cached and cached[0] == dir_mtime:
+            return cached[1]
+
         images = []
         try:
             for entry in os.scandir(device_dir):
-                real_path = os.path.realpath(entry.path)
-                if not os.path.isfile(real_path):
-                    continue
-                _, ext = os.path.splitext(entry.name.lower())
+                # Cheap name check first so non-images never cost a stat
+                ext = os.path.splitext(entry.name)[1].lower()
                 if ext not in SUPPORTED_EXTENSIONS:
                     continue
+                # One stat that follows symlinks; broken links are skipped
+                try:
+                    if not entry.is_file(follow_symlinks=True):
+                        continue
+                except OSError:
+                    continue
                 images.append(entry.name)
         except OSError as e:
-            print(f"Error scanning directory {device_dir}: {e}")
+            log_message(f"Error scanning directory {device_dir}: {e}")
             return []
 
         images.sort()
+        if mtime_is_settled(dir_mtime):
+            self._scan_cache[device_dir] = (dir_mtime, images)
         return images
 
     def peek_next_image(self, device_id: str = DEFAULT_DEVICE_ID) -> str | None:
         """Get path to the next image in rotation without advancing state."""
-        images = self._scan_directory(device_id)
+        device_dir = self._get_device_dir(device_id)
+        images = self._list_images(device_dir)
         if not images:
             return None
 
         state = self._get_device_state(device_id)
-        device_dir = self._get_device_dir(device_id)
 
         if state['current_index'] >= len(images):
             state['current_index'] = 0
@@ -588,8 +865,8 @@ class ImageRotator:
     def get_status(self, device_id: str = DEFAULT_DEVICE_ID) -> dict:
         """Get current rotation status for a specific device."""
         state = self._get_device_state(device_id)
-        images = self._scan_directory(device_id)
         device_dir = self._get_device_dir(device_id)
+        images = self._list_images(device_dir)
         return {
             'device_id': device_id,
             'current_image': state['last_returned'],
@@ -599,14 +876,30 @@ class ImageRotator:
             'image_list': images
         }
 
+    def list_all_images(self) -> list[str]:
+        """Return paths of every image in every device directory (and the fallback base dir)."""
+        image_dirs = []
+        try:
+            for entry in os.scandir(self.images_dir):
+                if entry.is_dir():
+                    image_dirs.append(entry.path)
+        except OSError:
+            return []
+
+        # Without a default/ directory, unknown devices fall back to the base directory
+        if not os.path.isdir(os.path.join(self.images_dir, DEFAULT_DEVICE_ID)):
+            image_dirs.append(self.images_dir)
+
+        paths = []
+        for image_dir in sorted(image_dirs):
+            paths.extend(os.path.join(image_dir, name) for name in self._list_images(image_dir))
+        return paths
+
     def get_all_devices(self) -> list[str]:
         """Get list of all devices with saved state."""
         return list(self._device_states.keys())
 
 
-# Initialize the image rotator
-_rotator = ImageRotator(IMAGES_DIR, STATE_FILE)
-
 # Battery voltage tracking per device: {device_id: {voltage, timestamp}}
 _battery_status = {}
 
@@ -653,9 +946,31 @@ def format_log_prefix(device_id: str | None = None, ip_address: str | None = Non
     return f"[{timestamp}] [server]"
 
 
+# Log lines are queued by the calling thread and written to stdout by one
+# listener thread, so request threads never wait on the stdout lock
+_log_queue = queue.SimpleQueue()
+_logger = logging.getLogger("eink")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+if _IN_PREPACK_PROCESS:
+    # Prepack worker processes log rarely and have no listener of their own
+    _logger.addHandler(logging.StreamHandler(sys.stdout))
+else:
+    _logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    _log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # Drains queued lines at exit
+
+
 def log_message(message: str, device_id: str | None = None, ip_address: str | None = None):
-    """Print a log line with a consistent request-aware prefix."""
-    print(f"{format_log_prefix(device_id=device_id, ip_address=ip_address)} {message}")
+    """Log a line with a consistent request-aware prefix."""
+    _logger.info(f"{format_log_prefix(device_id=device_id, ip_address=ip_address)} {message}")
+
+
+# Initialize the image rotator (prepack worker processes don't use it). It is
+# created after the log listener so its exit-time state flush is logged before
+# the listener drains and stops.
+_rotator = None if _IN_PREPACK_PROCESS else ImageRotator(IMAGES_DIR, STATE_FILE)
 
 
 def record_device_request(device_id: str):
@@ -710,128 +1025,787 @@ def log_request_summary(response):
     return response
 
 
-def create_palette_image():
+def create_palette_image(palette_rgb=PALETTE_RGB):
     """Create a palette image for PIL quantization."""
     palette_img = Image.new('P', (1, 1))
     palette_data = []
-    for r, g, b in PALETTE_RGB:
-        palette_data.extend([r, g, b])
+    for r, g, b in palette_rgb:
+        palette_data.extend([int(r), int(g), int(b)])
     # Pad to 256 colors (PIL requirement)
-    palette_data.extend([0, 0, 0] * (256 - len(PALETTE_RGB)))
+    palette_data.extend([0, 0, 0] * (256 - len(palette_rgb)))
     palette_img.putpalette(palette_data)
     return palette_img
 
 
-def process_image_to_packed(image_path, contrast=DEFAULT_CONTRAST,
-                            brightness=DEFAULT_BRIGHTNESS,
-                            saturation=DEFAULT_SATURATION):
+# The palette never changes, so build the quantization palette image once.
+# It holds linear-light colors to match the linearized input of the fallback.
+if PIL_AVAILABLE:
+    _PALETTE_IMG = create_palette_image(SRGB_TO_LINEAR8[np.asarray(PALETTE_RGB)])
+
+
+# The kernels are compiled with nogil=True: they only touch NumPy arrays, so
+# they release the GIL and request threads (e.g. /hash polls) keep running
+# while an image is being dithered
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, nogil=True)
+    def mean_luma(rgb, brightness):
+        """Mean BT.601 luminance after brightness, the pivot used for contrast."""
+        height, width, _ = rgb.shape
+        total = 0.0
+        for y in range(height):
+            for x in range(width):
+                r = min(rgb[y, x, 0] * brightness, 255.0)
+                g = min(rgb[y, x, 1] * brightness, 255.0)
+                b = min(rgb[y, x, 2] * brightness, 255.0)
+                total += 0.299 * r + 0.587 * g + 0.114 * b
+        return total / (height * width)
+
+    @njit(fastmath=True, nogil=True, inline='always')
+    def enhanced_linear_pixel(rgb, y, x, tone_lut, saturation, srgb_to_lin):
+        """
+        Enhance one pixel and return it in linear light, shared by every dither kernel.
+
+        Brightness and contrast are per-channel point ops fused into one
+        lookup; saturation mixes channels so it stays per pixel.
+        """
+        r = tone_lut[rgb[y, x, 0]]
+        g = tone_lut[rgb[y, x, 1]]
+        b = tone_lut[rgb[y, x, 2]]
+        gray = 0.299 * r + 0.587 * g + 0.114 * b
+        r = min(max(gray + (r - gray) * saturation, 0.0), 255.0)
+        g = min(max(gray + (g - gray) * saturation, 0.0), 255.0)
+        b = min(max(gray + (b - gray) * saturation, 0.0), 255.0)
+        return srgb_to_lin[int(r + 0.5)], srgb_to_lin[int(g + 0.5)], srgb_to_lin[int(b + 0.5)]
+
+    @njit(fastmath=True, nogil=True, inline='always')
+    def nearest_palette_index(r, g, b, nearest_lut, lin_to_srgb):
+        """Map a linear-light color (channels in 0.0-1.0) to its nearest palette index."""
+        lin_max = lin_to_srgb.size - 1
+        sr = lin_to_srgb[int(r * lin_max)]
+        sg = lin_to_srgb[int(g * lin_max)]
+        sb = lin_to_srgb[int(b * lin_max)]
+        return nearest_lut[(sr >> 3) << 10 | (sg >> 3) << 5 | (sb >> 3)]
+
+    @njit(cache=True, fastmath=True, nogil=True)
+    def fs_dither_pack(rgb, tone_lut, saturation,
+                       palette, nearest_lut, hardware_codes, srgb_to_lin, lin_to_srgb):
+        """
+        Floyd-Steinberg dither an RGB array straight to packed 4bpp hardware codes.
+
+        Enhancement, nearest-color search, error diffusion and nibble packing
+        are done in a single pass, so no intermediate image is produced. Error
+        is diffused in linear light to avoid the brightness shift of dithering
+        in gamma-encoded sRGB.
+
+        Args:
+            rgb: uint8 array of shape (height, width, 3)
+            tone_lut: float32 array of 256 brightness+contrast levels (see build_tone_lut)
+            saturation: Saturation factor (1.0 = original)
+            palette: float32 array of shape (colors, 3), linear light
+            nearest_lut: uint8 array of 32768 nearest palette indices (see build_nearest_lut)
+            hardware_codes: uint8 array with the hardware code for each palette index
+            srgb_to_lin: float32 array mapping sRGB 0-255 to linear 0.0-1.0
+            lin_to_srgb: uint8 array mapping quantized linear values back to sRGB
+
+        Returns:
+            uint8 array of (height * width + 1) // 2 packed bytes
+        """
+        height, width, _ = rgb.shape
+        packed = np.empty((height * width + 1) // 2, dtype=np.uint8)
+
+        # Error accumulators for three consecutive rows, padded by one column on
+        # each side so diffusion at the edges needs no bounds checks. Rows are
+        # processed in pairs: the first row diffuses into err[1], the second
+        # consumes err[1] while it is still in cache and diffuses into err[2].
+        err = np.zeros((3, width + 2, 3), dtype=np.float32)
+
+        for y0 in range(0, height, 2):
+            for dy in range(2):
+                y = y0 + dy
+                if y >= height:
+                    break
+                cur = err[dy]
+                nxt = err[dy + 1]
+
+                # Error carried to the right-hand neighbour (7/16)
+                cr = 0.0
+                cg = 0.0
+                cb = 0.0
+
+                for x in range(width):
+                    r, g, b = enhanced_linear_pixel(rgb, y, x, tone_lut, saturation, srgb_to_lin)
+                    r = min(max(r + cur[x + 1, 0] + cr, 0.0), 1.0)
+                    g = min(max(g + cur[x + 1, 1] + cg, 0.0), 1.0)
+                    b = min(max(b + cur[x + 1, 2] + cb, 0.0), 1.0)
+                    best = nearest_palette_index(r, g, b, nearest_lut, lin_to_srgb)
+
+                    # Even pixels fill the high nibble, odd pixels the low nibble
+                    i = y * width + x
+                    if i & 1:
+                        packed[i >> 1] |= hardware_codes[best]
+                    else:
+                        packed[i >> 1] = hardware_codes[best] << 4
+
+                    er = r - palette[best, 0]
+                    eg = g - palette[best, 1]
+                    eb = b - palette[best, 2]
+
+                    cr = er * 0.4375
+                    cg = eg * 0.4375
+                    cb = eb * 0.4375
+                    nxt[x, 0] += er * 0.1875
+                    nxt[x, 1] += eg * 0.1875
+                    nxt[x, 2] += eb * 0.1875
+                    nxt[x + 1, 0] += er * 0.3125
+                    nxt[x + 1, 1] += eg * 0.3125
+                    nxt[x + 1, 2] += eb * 0.3125
+                    nxt[x + 2, 0] += er * 0.0625
+                    nxt[x + 2, 1] += eg * 0.0625
+                    nxt[x + 2, 2] += eb * 0.0625
+
+            # The row after the pair becomes the first row of the next pair
+            err[0] = err[2]
+            err[1] = 0.0
+            err[2] = 0.0
+
+        return packed
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, nogil=True, parallel=True)
+    def ordered_dither_pack(rgb, tone_lut, saturation, threshold, strength,
+                            nearest_lut, hardware_codes, srgb_to_lin, lin_to_srgb):
+        """
+        Ordered (Bayer) dither an RGB array straight to packed 4bpp hardware codes.
+
+        Each pixel is offset by its threshold cell in linear light and mapped to
+        the nearest palette color independently, so rows run in parallel.
+        Requires an even width, so every output byte belongs to a single row.
+
+        Args:
+            rgb: uint8 array of shape (height, width, 3)
+            tone_lut: float32 array of 256 brightness+contrast levels (see build_tone_lut)
+            saturation: Saturation factor (1.0 = original)
+            threshold: float32 square threshold matrix in (0, 1) (see build_bayer_matrix)
+            strength: Spread of the threshold offsets in linear light
+            nearest_lut: uint8 array of 32768 nearest palette indices (see build_nearest_lut)
+            hardware_codes: uint8 array with the hardware code for each palette index
+            srgb_to_lin: float32 array mapping sRGB 0-255 to linear 0.0-1.0
+            lin_to_srgb: uint8 array mapping quantized linear values back to sRGB
+
+        Returns:
+            uint8 array of height * width // 2 packed bytes
+        """
+        height, width, _ = rgb.shape
+        packed = np.empty(height * width // 2, dtype=np.uint8)
+        tsize = threshold.shape[0]
+
+        for y in prange(height):
+            for x in range(width):
+                r, g, b = enhanced_linear_pixel(rgb, y, x, tone_lut, saturation, srgb_to_lin)
+                offset = (threshold[y % tsize, x % tsize] - 0.5) * strength
+                r = min(max(r + offset, 0.0), 1.0)
+                g = min(max(g + offset, 0.0), 1.0)
+                b = min(max(b + offset, 0.0), 1.0)
+                best = nearest_palette_index(r, g, b, nearest_lut, lin_to_srgb)
+
+                # Even pixels fill the high nibble, odd pixels the low nibble
+                i = y * width + x
+                if i & 1:
+                    packed[i >> 1] |= hardware_codes[best]
+                else:
+                    packed[i >> 1] = hardware_codes[best] << 4
+
+        return packed
+
+
+def build_tone_lut(brightness: float, contrast: float, contrast_pivot: float) -> np.ndarray:
     """
-    Process an image file to packed 4bpp binary data for the Spectra 6 display.
+    Fuse brightness and contrast into one 256-entry lookup table.
+
+    Both are per-channel point operations, so their composition (with the
+    same clamping as the ImageEnhance chain) depends only on the input level.
 
     Args:
-        image_path: Path to the source image
-        contrast: Contrast enhancement factor (1.0 = original)
-        brightness: Brightness enhancement factor (1.0 = original)
-        saturation: Saturation enhancement factor (1.0 = original)
+        brightness: Brightness factor (1.0 = original)
+        contrast: Contrast factor (1.0 = original)
+        contrast_pivot: Mean luminance that contrast scales around (see mean_luma)
 
     Returns:
-        bytes: Packed binary data (960,000 bytes)
+        float32 array of 256 output levels in 0.0-255.0
     """
-    if not PIL_AVAILABLE:
-        raise RuntimeError("PIL not available")
+    levels = np.minimum(np.arange(256, dtype=np.float64) * brightness, 255.0)
+    levels = np.clip((levels - contrast_pivot) * contrast + contrast_pivot, 0.0, 255.0)
+    return levels.astype(np.float32)
+
+
+def warm_up_dither_kernels():
+    """
+    Compile the Numba kernels (or load them from Numba's on-disk cache) up front.
+
+    Runs them on a tiny array with the same argument types as
+    process_image_to_packed, so the first real cache miss doesn't also pay
+    the JIT compile.
+    """
+    if not NUMBA_AVAILABLE:
+        return
+
+    start = time.perf_counter()
+    rgb = np.zeros((2, 2, 3), dtype=np.uint8)
+    rgb.flags.writeable = False  # np.asarray(PIL image) is read-only; match its type
+    contrast_pivot = float(int(mean_luma(rgb, DEFAULT_BRIGHTNESS) + 0.5))
+    tone_lut = build_tone_lut(DEFAULT_BRIGHTNESS, DEFAULT_CONTRAST, contrast_pivot)
+    if DITHER_MODE == "ordered":
+        ordered_dither_pack(rgb, tone_lut, DEFAULT_SATURATION,
+                            BAYER_8X8, ORDERED_DITHER_STRENGTH,
+                            NEAREST_LUT, HARDWARE_CODES_ARRAY,
+                            SRGB_TO_LINEAR, LINEAR_TO_SRGB)
+    else:
+        fs_dither_pack(rgb, tone_lut, DEFAULT_SATURATION,
+                       PALETTE_LINEAR, NEAREST_LUT, HARDWARE_CODES_ARRAY,
+                       SRGB_TO_LINEAR, LINEAR_TO_SRGB)
+    log_message(f"Dither kernels ready in {time.perf_counter() - start:.2f}s")
+
+
+def apply_enhancements(rgb: np.ndarray, contrast=DEFAULT_CONTRAST,
+                       brightness=DEFAULT_BRIGHTNESS,
+                       saturation=DEFAULT_SATURATION) -> np.ndarray:
+    """
+    Apply brightness, contrast and saturation to an RGB array in one float buffer.
+
+    Matches the ImageEnhance Brightness -> Contrast -> Color chain (contrast
+    pivots on the mean luminance, saturation blends with BT.601 gray), but
+    converts to float once and updates in place instead of allocating a new
+    image per enhancer. Used by the PIL dithering path; the Numba kernel
+    applies the same math per pixel.
+
+    Args:
+        rgb: uint8 array of shape (height, width, 3)
+
+    Returns:
+        uint8 array of shape (height, width, 3)
+    """
+    if brightness == 1.0 and contrast == 1.0 and saturation == 1.0:
+        return rgb
+
+    arr = rgb.astype(np.float32)
+    luma = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    if brightness != 1.0:
+        arr *= brightness
+        np.clip(arr, 0.0, 255.0, out=arr)
+    if contrast != 1.0:
+        mean = float(np.rint((arr @ luma).mean()))
+        arr -= mean
+        arr *= contrast
+        arr += mean
+        np.clip(arr, 0.0, 255.0, out=arr)
+    if saturation != 1.0:
+        gray = (arr @ luma)[..., None]
+        arr -= gray
+        arr *= saturation
+        arr += gray
+        np.clip(arr, 0.0, 255.0, out=arr)
+
+    return arr.astype(np.uint8)
+
+
+def load_frame_rgb_pil(image_path: str) -> np.ndarray:
+    """
+    Decode, orient, cover-crop and rotate an image to the 1600x1200 buffer layout with Pillow.
 
+    Returns:
+        uint8 array of shape (FRAME_HEIGHT, FRAME_WIDTH, 3)
+    """
     # Open and prepare image
     img = Image.open(image_path)
-    img = ImageOps.exif_transpose(img)  # Handle EXIF orientation (camera rotation)
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding, as long
+    # as both sides stay >= FRAME_WIDTH (covers the frame in either orientation,
+    # since EXIF rotation is applied afterwards). No-op for other formats.
+    img.draft("RGB", (FRAME_WIDTH, FRAME_WIDTH))
+    # Handle EXIF orientation (camera rotation); exif_transpose copies the whole
+    # image even when there is nothing to do, so only call it when needed
+    if img.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1:
+        img = ImageOps.exif_transpose(img)
     img = img.convert("RGB")
 
     # For portrait-mounted display: fit to portrait dimensions first,
-    # then rotate to match the 1600x1200 buffer layout expected by firmware
+    # then rotate to match the 1600x1200 buffer layout expected by firmware.
+    # Downscales use BOX (a true area average, ~4x faster than LANCZOS; the
+    # dither hides the difference); sources smaller than the frame keep LANCZOS.
+    if img.width >= FRAME_HEIGHT and img.height >= FRAME_WIDTH:
+        resample = Image.Resampling.BOX
+    else:
+        resample = Image.Resampling.LANCZOS
     img = ImageOps.fit(img, (FRAME_HEIGHT, FRAME_WIDTH),  # 1200x1600 portrait
-                       method=Image.Resampling.LANCZOS,
+                       method=resample,
                        centering=(0.5, 0.0))
 
     # Rotate 270° (90° clockwise) to convert portrait image to landscape buffer
     # and match the physical display orientation with board attached at bottom
-    img = img.rotate(270, expand=True)
+    img = img.transpose(Image.Transpose.ROTATE_270)
 
-    # Apply enhancements
-    if brightness != 1.0:
-        img = ImageEnhance.Brightness(img).enhance(brightness)
-    if contrast != 1.0:
-        img = ImageEnhance.Contrast(img).enhance(contrast)
-    if saturation != 1.0:
-        img = ImageEnhance.Color(img).enhance(saturation)
+    return np.asarray(img)
+
+
+def load_frame_rgb_vips(image_path: str) -> np.ndarray:
+    """
+    Same as load_frame_rgb_pil, using libvips.
+
+    vips shrinks JPEGs while decoding and resizes with fewer passes over
+    memory. Raises pyvips.Error for files vips can't load (e.g. HEIC on
+    builds without libheif).
+
+    Returns:
+        uint8 array of shape (FRAME_HEIGHT, FRAME_WIDTH, 3)
+    """
+    # Header only: source size after EXIF orientation, to compute the cover scale
+    header = pyvips.Image.new_from_file(image_path)
+    width, height = header.width, header.height
+    if header.get_typeof('orientation') and header.get('orientation') in (5, 6, 7, 8):
+        width, height = height, width
+    scale = max(FRAME_HEIGHT / width, FRAME_WIDTH / height)
+
+    # thumbnail() applies EXIF orientation and shrink-on-load; force the exact
+    # cover size so the crop below never comes up a pixel short
+    img = pyvips.Image.thumbnail(image_path, max(FRAME_HEIGHT, math.ceil(width * scale)),
+                                 height=max(FRAME_WIDTH, math.ceil(height * scale)),
+                                 size='force')
+    if img.interpretation != 'srgb':
+        img = img.colourspace('srgb')
+    if img.bands > 3:
+        img = img.extract_band(0, n=3)  # Drop alpha, as Image.convert("RGB") does
+    if img.format != 'uchar':
+        img = img.cast('uchar')
+
+    # Same centering as the Pillow path: centered horizontally, top-aligned vertically
+    img = img.crop((img.width - FRAME_HEIGHT) // 2, 0, FRAME_HEIGHT, FRAME_WIDTH)
+    # Rotating reads the image column by column, so render it into memory first
+    # (the decoder only supports top-to-bottom reads)
+    img = img.copy_memory().rot90()  # Clockwise, like Image.Transpose.ROTATE_270
+
+    return np.ndarray(buffer=img.write_to_memory(), dtype=np.uint8,
+                      shape=(img.height, img.width, img.bands))
+
+
+def load_frame_rgb(image_path: str) -> np.ndarray:
+    """Load an image as a frame-sized RGB array, with libvips when available."""
+    if PYVIPS_AVAILABLE:
+        try:
+            return load_frame_rgb_vips(image_path)
+        except pyvips.Error as e:
+            log_message(f"libvips could not load {image_path}, using Pillow: {e}")
+    return load_frame_rgb_pil(image_path)
+
+
+def process_image_to_packed(image_path, contrast=DEFAULT_CONTRAST,
+                            brightness=DEFAULT_BRIGHTNESS,
+                            saturation=DEFAULT_SATURATION,
+                            dither_mode=DITHER_MODE):
+    """
+    Process an image file to packed 4bpp binary data for the Spectra 6 display.
 
-    # Quantize to 6-color palette with Floyd-Steinberg dithering
-    palette_img = create_palette_image()
-    dithered = img.quantize(
+    Args:
+        image_path: Path to the source image
+        contrast: Contrast enhancement factor (1.0 = original)
+        brightness: Brightness enhancement factor (1.0 = original)
+        saturation: Saturation enhancement factor (1.0 = original)
+        dither_mode: "floyd-steinberg" or "ordered" (see DITHER_MODE)
+
+    Returns:
+        bytes: Packed binary data (960,000 bytes)
+    """
+    if not PIL_AVAILABLE:
+        raise RuntimeError("PIL not available")
+
+    rgb = load_frame_rgb(image_path)
+
+    # Enhance and quantize to 6-color palette with the selected dithering
+    if NUMBA_AVAILABLE:
+        contrast_pivot = float(int(mean_luma(rgb, brightness) + 0.5))
+        tone_lut = build_tone_lut(brightness, contrast, contrast_pivot)
+        if dither_mode == "ordered":
+            packed_data = ordered_dither_pack(rgb, tone_lut, saturation,
+                                              BAYER_8X8, ORDERED_DITHER_STRENGTH,
+                                              NEAREST_LUT, HARDWARE_CODES_ARRAY,
+                                              SRGB_TO_LINEAR, LINEAR_TO_SRGB)
+            return packed_data.tobytes()
+        packed_data = fs_dither_pack(rgb, tone_lut, saturation,
+                                     PALETTE_LINEAR, NEAREST_LUT, HARDWARE_CODES_ARRAY,
+                                     SRGB_TO_LINEAR, LINEAR_TO_SRGB)
+        return packed_data.tobytes()
+
+    rgb = apply_enhancements(rgb, contrast=contrast, brightness=brightness, saturation=saturation)
+    # Linearize so PIL's Floyd-Steinberg diffuses error in linear light
+    rgb = SRGB_TO_LINEAR8[rgb]
+    # With a fixed palette, quantize() maps straight to it and ignores `method`
+    # (median cut / libimagequant only matter when Pillow builds the palette)
+    dithered = Image.fromarray(rgb).quantize(
         colors=len(PALETTE_RGB),
-        palette=palette_img,
+        palette=_PALETTE_IMG,
         dither=Image.Dither.FLOYDSTEINBERG
     )
 
-    # Pack bits (2 pixels per byte)
-    pixels = list(dithered.get_flattened_data())
-    packed_data = bytearray()
+    # Pack bits (2 pixels per byte): view each pixel pair as one uint16 and map
+    # it to the packed hardware-code byte with a single table lookup
+    # (the frame has an even pixel count)
+    pixel_pairs = np.frombuffer(dithered.tobytes(), dtype='<u2')
+    packed_data = PAIR_PACK_LUT[pixel_pairs]
+
+    return packed_data.tobytes()
+
+
+def _lookup_image_cache(source_key: tuple, source_sig: tuple) -> dict | None:
+    """Return the cache entry if it holds this exact source, else None."""
+    with _image_cache_lock:
+        entry = _image_cache.get(source_key)
+        if entry is None or entry['source_sig'] != source_sig:
+            return None
+        _image_cache.move_to_end(source_key)
+        return entry
 
-    for i in range(0, len(pixels), 2):
-        p1_idx = pixels[i]
-        p2_idx = pixels[i+1] if i+1 < len(pixels) else 0
 
-        val1 = HARDWARE_MAP.get(p1_idx, 0x01)
-        val2 = HARDWARE_MAP.get(p2_idx, 0x01)
+def _source_lock(source_key: tuple) -> threading.Lock:
+    """Return the lock that serializes processing of one source image."""
+    with _source_locks_lock:
+        lock = _source_locks.get(source_key)
+        if lock is None:
+            lock = _source_locks[source_key] = threading.Lock()
+        return lock
 
-        byte_val = (val1 << 4) | val2
-        packed_data.append(byte_val)
 
-    return bytes(packed_data)
+def _store_image_cache(source_key: tuple, entry: dict):
+    """Insert an entry as most recently used, evicting the oldest beyond the limit."""
+    with _image_cache_lock:
+        _image_cache[source_key] = entry
+        _image_cache.move_to_end(source_key)
+        while len(_image_cache) > IMAGE_CACHE_MAX_ENTRIES:
+            _image_cache.popitem(last=False)
 
 
-def get_cached_image_data(image_path: str):
+def get_packed_cache_paths(source_key: tuple) -> tuple[str, str]:
+    """Return the (.bin, .json) disk cache paths for a source's (st_dev, st_ino)."""
+    dev, ino = source_key
+    base = os.path.join(PACKED_CACHE_DIR, f"{dev:x}-{ino:x}")
+    return base + '.bin', base + '.json'
+
+
+def load_packed_cache_meta(source_key: tuple, source_sig: tuple) -> dict | None:
+    """Load the disk cache sidecar if it matches the source signature."""
+    _, meta_path = get_packed_cache_paths(source_key)
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    if (not isinstance(meta, dict) or
+        meta.get('v') != PACKED_CACHE_VERSION or
+        meta.get('dither') != DITHER_MODE or
+        meta.get('hash_algo') != HASH_ALGO or
+        meta.get('sig') != list(source_sig)):
+        return None
+    return meta
+
+
+def load_packed_cache(source_key: tuple, source_sig: tuple):
+    """Load (packed_data, hash) from the disk cache if it matches the source signature."""
+    meta = load_packed_cache_meta(source_key, source_sig)
+    if meta is None:
+        return None
+
+    bin_path, _ = get_packed_cache_paths(source_key)
+    try:
+        with open(bin_path, 'rb') as f:
+            packed_data = f.read()
+    except OSError:
+        return None
+
+    if len(packed_data) != meta.get('size'):
+        return None
+    return packed_data, meta['hash']
+
+
+def _replace_atomically(path: str, data: bytes):
+    """Write data to a unique temp file in the cache dir, then rename it over path."""
+    fd, tmp_path = tempfile.mkstemp(dir=PACKED_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_packed_cache(source_key: tuple, source_sig: tuple, packed_data: bytes,
+                      image_hash: str, image_path: str):
     """
-    Get processed image data, using cache if source hasn't changed.
+    Atomically persist packed data and its signature sidecar to the disk cache.
 
-    Args:
-        image_path: Path to the image file to process
+    Each file goes through its own temp file, so concurrent writers of the
+    same source (a prepack process and a request thread) never share one.
+    """
+    bin_path, meta_path = get_packed_cache_paths(source_key)
+    meta = {
+        'v': PACKED_CACHE_VERSION,
+        'dither': DITHER_MODE,
+        'source_path': os.path.abspath(image_path),  # Informational; the file name is the key
+        'sig': list(source_sig),
+        'size': len(packed_data),
+        'hash': image_hash,
+        'hash_algo': HASH_ALGO,
+    }
+    try:
+        os.makedirs(PACKED_CACHE_DIR, exist_ok=True)
+        # Write the data before the sidecar: the sidecar is what marks the entry valid
+        _replace_atomically(bin_path, packed_data)
+        _replace_atomically(meta_path, json.dumps(meta).encode())
+    except OSError as e:
+        log_message(f"Error writing packed cache for {image_path}: {e}")
+
+
+def prune_packed_cache() -> int:
+    """
+    Delete disk cache entries that can never be hit again.
+
+    An entry is stale when its sidecar is from another cache version or
+    dither mode, or when its source_path no longer stats to the same
+    (st_dev, st_ino) and signature (deleted, replaced or rewritten). Files
+    that don't belong to a valid sidecar (leftover .tmp files, data without
+    a sidecar, older naming schemes) are removed too. Run at startup, before
+    requests can write to the cache.
 
     Returns:
-        tuple: (packed_data, hash) or (None, None) if error
+        int: Number of files deleted
     """
-    global _image_cache
+    try:
+        entries = list(os.scandir(PACKED_CACHE_DIR))
+    except FileNotFoundError:
+        return 0
+
+    keep = set()
+    for entry in entries:
+        base, ext = os.path.splitext(entry.name)
+        if ext != '.json':
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                meta = json.load(f)
+            dev, ino = (int(part, 16) for part in base.split('-'))
+            st = os.stat(meta['source_path'])
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        if (isinstance(meta, dict) and
+                meta.get('v') == PACKED_CACHE_VERSION and
+                meta.get('dither') == DITHER_MODE and
+                meta.get('hash_algo') == HASH_ALGO and
+                (st.st_dev, st.st_ino) == (dev, ino) and
+                meta.get('sig') == [st.st_mtime_ns, st.st_size]):
+            keep.add(base)
+
+    removed = 0
+    for entry in entries:
+        base, ext = os.path.splitext(entry.name)
+        if base in keep and ext in ('.bin', '.json'):
+            continue
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except OSError as e:
+            log_message(f"Error pruning packed cache file {entry.name}: {e}")
+    return removed
 
-    if not os.path.exists(image_path):
-        return None, None
 
-    # Resolve symlinks for consistent path comparison
-    real_path = os.path.realpath(image_path)
+def send_packed_cache_file(source: tuple, image_hash: str) -> Response | None:
+    """
+    Return a send_file response for a source's packed data in the disk cache.
+
+    Under a WSGI server with wsgi.file_wrapper the kernel sends the file
+    straight from the page cache (sendfile), instead of copying the 960KB
+    buffer through Python. conditional=True answers If-None-Match (against
+    the content hash as ETag) with 304 and supports Range requests.
+
+    Returns None unless the sidecar matches both the source signature and
+    image_hash: if the cache write for the current contents failed, the file
+    still holds an older image, and sending it under the new hash would
+    leave the device showing the old image for good. The caller then serves
+    the in-memory copy. The sidecar is checked before the file is opened, so
+    a concurrent rewrite can only make the body newer than the hash; the
+    next /hash poll then reports its hash and the device fetches again.
+    """
+    source_key, source_sig = source
+    meta = load_packed_cache_meta(source_key, source_sig)
+    if meta is None or meta.get('hash') != image_hash:
+        return None
 
-    # Check if source image has changed
-    current_mtime = os.path.getmtime(real_path)
+    bin_path, _ = get_packed_cache_paths(source_key)
+    try:
+        return send_file(bin_path, mimetype='application/octet-stream',
+                         conditional=True, etag=image_hash)
+    except OSError:
+        return None
 
-    if (_image_cache['data'] is not None and
-        _image_cache['source_path'] == real_path and
-        _image_cache['source_mtime'] == current_mtime):
-        # Cache is valid
-        return _image_cache['data'], _image_cache['hash']
 
-    # Process the image
-    log_message(f"Processing image: {image_path}")
-    packed_data = process_image_to_packed(image_path)
+def stat_source_image(image_path: str) -> tuple[tuple, tuple] | None:
+    """
+    Return (key, signature) for a source image, or None if it can't be stat'ed.
+
+    A single stat (following symlinks) checks existence and gives both.
+    The key is the file identity (st_dev, st_ino), so every path or symlink
+    to the same file shares one cache entry without resolving the path.
+    The signature (mtime_ns, size) detects in-place rewrites; an atomic
+    replace gets a new inode and therefore a new key.
+    """
+    try:
+        st = os.stat(image_path)
+    except OSError:  # Missing, but also ELOOP/EACCES/ENOTDIR, like os.path.exists
+        return None
+
+    return (st.st_dev, st.st_ino), (st.st_mtime_ns, st.st_size)
 
-    # Compute hash (using first 16 chars of MD5)
-    image_hash = hashlib.md5(packed_data).hexdigest()[:16]
 
-    # Update cache
-    _image_cache['data'] = packed_data
-    _image_cache['hash'] = image_hash
-    _image_cache['source_path'] = real_path
-    _image_cache['source_mtime'] = current_mtime
+def hash_packed_data(packed_data: bytes) -> str:
+    """Return a 16 hex char digest of packed data; only used for change detection."""
+    if BLAKE3_AVAILABLE:
+        return blake3(packed_data).hexdigest(length=8)
+    return hashlib.blake2b(packed_data, digest_size=8).hexdigest()
 
+
+def _process_and_save(image_path: str, source_key: tuple, source_sig: tuple) -> tuple[bytes, str]:
+    """Process an image, write it to the disk cache and return (packed_data, hash)."""
+    log_message(f"Processing image: {image_path}")
+    packed_data = process_image_to_packed(image_path)
+
+    image_hash = hash_packed_data(packed_data)
+    save_packed_cache(source_key, source_sig, packed_data, image_hash, image_path)
     log_message(f"Image processed, hash: {image_hash}")
     return packed_data, image_hash
 
 
+def ensure_packed_cache(image_path: str) -> bool:
+    """
+    Make sure an image is in the disk cache, processing it if needed.
+
+    Unlike get_cached_image_entry this leaves the in-memory LRU alone, so
+    prepacking a large gallery doesn't evict the images devices are using.
+
+    Returns:
+        bool: True if the image had to be processed
+    """
+    source = stat_source_image(image_path)
+    if source is None:
+        return False
+    source_key, source_sig = source
+
+    with _source_lock(source_key):
+        if (_lookup_image_cache(source_key, source_sig) or
+                load_packed_cache_meta(source_key, source_sig)):
+            return False
+        _process_and_save(image_path, source_key, source_sig)
+        return True
+
+
+def get_cached_image_entry(image_path: str, source: tuple | None = None) -> dict | None:
+    """
+    Get the processed image cache entry, using cache if source hasn't changed.
+
+    Checks the in-memory cache first, then the on-disk cache in
+    PACKED_CACHE_DIR (which survives restarts), and only then processes
+    the image.
+
+    Args:
+        image_path: Path to the image file to process
+        source: stat_source_image() result if the caller already has it
+
+    Returns:
+        dict | None: Cache entry with 'data' and 'hash', or None if missing
+    """
+    if source is None:
+        source = stat_source_image(image_path)
+    if source is None:
+        return None
+    source_key, source_sig = source
+
+    cached = _lookup_image_cache(source_key, source_sig)
+    if cached:
+        return cached
+
+    # A prepack process working on this source writes it to the disk cache.
+    # It may still be queued behind the rest of the backlog, so only wait
+    # briefly; after that, the image is processed here
+    prepack_done = _prepack_in_flight.get(source_key)
+    if prepack_done is not None:
+        prepack_done.wait(PREPACK_WAIT_SECONDS)
+
+    with _source_lock(source_key):
+        # Another thread may have processed the image while we waited
+        cached = _lookup_image_cache(source_key, source_sig)
+        if cached:
+            return cached
+
+        # A previous run may already have processed this exact source
+        cached = load_packed_cache(source_key, source_sig)
+        if cached:
+            packed_data, image_hash = cached
+            log_message(f"Loaded packed cache for {image_path}, hash: {image_hash}")
+        else:
+            packed_data, image_hash = _process_and_save(image_path, source_key, source_sig)
+
+        entry = {
+            'data': packed_data,
+            'hash': image_hash,
+            'gzip': None,
+            'source_sig': source_sig,
+        }
+        _store_image_cache(source_key, entry)
+        return entry
+
+
+def get_packed_gzip(entry: dict) -> bytes:
+    """
+    Return the gzip-compressed copy of a cache entry's data, compressing it on first use.
+
+    Only clients that send Accept-Encoding: gzip need it (the firmware
+    doesn't), so entries are stored without one. Two concurrent first
+    requests may both compress; either result is the same.
+    """
+    packed_gzip = entry['gzip']
+    if packed_gzip is None:
+        packed_gzip = entry['gzip'] = gzip.compress(entry['data'], compresslevel=PACKED_GZIP_LEVEL)
+    return packed_gzip
+
+
+def get_cached_image_hash(image_path: str, source: tuple | None = None) -> str | None:
+    """
+    Get just the hash of the processed image.
+
+    Answers from the in-memory cache or the disk cache sidecar when the
+    source is unchanged, so polling /hash never reads the 960KB data or
+    touches PIL. Only falls back to full processing on a real miss.
+    Pass the stat_source_image() result as source to skip another stat.
+    """
+    if source is None:
+        source = stat_source_image(image_path)
+    if source is None:
+        return None
+    source_key, source_sig = source
+
+    cached = _lookup_image_cache(source_key, source_sig)
+    if cached:
+        return cached['hash']
+
+    meta = load_packed_cache_meta(source_key, source_sig)
+    if meta:
+        return meta['hash']
+
+    entry = get_cached_image_entry(image_path, source)
+    return entry['hash'] if entry else None
+
+
 def get_current_image_path(device_id: str = DEFAULT_DEVICE_ID) -> str | None:
     """
     Get the path to the current image to display for a device.
@@ -857,82 +1831,232 @@ def get_current_image_path(device_id: str = DEFAULT_DEVICE_ID) -> str | None:
     return None
 
 
-def get_next_image_path(device_id: str = DEFAULT_DEVICE_ID) -> str | None:
+def get_pending_image(device_id: str = DEFAULT_DEVICE_ID) -> tuple[str, tuple] | None:
     """
-    Get the path to the next image to display (advances rotation) for a device.
+    Get the next image that would be served to a device without advancing rotation.
 
-    Uses image rotation if images directory exists with images,
-    otherwise falls back to DEFAULT_IMAGE_PATH.
-
-    Args:
-        device_id: Device identifier (normalized MAC address)
+    This is used so /hash and /image_packed describe the same image. The
+    existence check is the stat_source_image() call itself, and its result is
+    returned with the path so the cache lookups don't stat the file again.
 
     Returns:
-        str | None: Path to the image file, or None if no image available
+        tuple | None: (image_path, stat_source_image() result), or None if no image available
     """
-    # Try rotation first
-    next_image = _rotator.get_next_image(device_id)
-    if next_image and os.path.exists(next_image):
-        return next_image
+    next_image = _rotator.peek_next_image(device_id)
+    if next_image:
+        source = stat_source_image(next_image)
+        if source is not None:
+            return next_image, source
 
-    # Fall back to default
-    if os.path.exists(DEFAULT_IMAGE_PATH):
-        return DEFAULT_IMAGE_PATH
+    source = stat_source_image(DEFAULT_IMAGE_PATH)
+    if source is not None:
+        return DEFAULT_IMAGE_PATH, source
 
     return None
 
 
-def get_pending_image_path(device_id: str = DEFAULT_DEVICE_ID) -> str | None:
+def prepack_pending_images():
     """
-    Get the next image that would be served to a device without advancing rotation.
+    Process the image each known device will be served next, if not cached yet.
 
-    This is used so /hash and /image_packed describe the same image.
+    Keeps the in-memory and disk caches ahead of the rotation so /hash and
+    /image_packed are answered from cache instead of processing on request.
     """
-    next_image = _rotator.peek_next_image(device_id)
-    if next_image and os.path.exists(next_image):
-        return next_image
+    device_ids = set(_rotator.get_all_devices())
+    device_ids.add(DEFAULT_DEVICE_ID)
+    for device_id in sorted(device_ids):
+        pending = get_pending_image(device_id)
+        if pending is None:
+            continue
+        image_path, source = pending
+        if source[0] in _prepack_in_flight:
+            continue  # A prepack process has it; waiting here would stall the backlog
+        try:
+            get_cached_image_entry(image_path, source)
+        except Exception as e:
+            log_message(f"Prepack failed for {image_path}: {e}", device_id=device_id)
 
-    if os.path.exists(DEFAULT_IMAGE_PATH):
-        return DEFAULT_IMAGE_PATH
 
-    return None
+def _find_unpacked_images() -> list[str]:
+    """
+    Return the gallery images that are in neither the in-memory nor the disk cache.
+
+    Each image is stat'ed; its sidecar is read only if the image is new or
+    changed since the previous scan found it cached.
+    """
+    global _prepack_verified
+    verified = set()
+    missing = []
+    for image_path in _rotator.list_all_images():
+        source = stat_source_image(image_path)
+        if source is None:
+            continue
+        if (source in _prepack_verified or
+                _lookup_image_cache(*source) is not None or
+                load_packed_cache_meta(*source) is not None):
+            verified.add(source)
+        else:
+            missing.append(image_path)
+    _prepack_verified = verified
+    return missing
+
+
+def _prepack_in_subprocess(image_path: str) -> str:
+    """ProcessPoolExecutor task: process one image into the disk cache."""
+    source = stat_source_image(image_path)
+    if source is not None and load_packed_cache_meta(*source) is None:
+        _process_and_save(image_path, *source)
+    return image_path
+
+
+def _prepack_in_processes(image_paths: list[str]):
+    """
+    Process images in PREPACK_PROCESSES worker processes.
+
+    Each submitted source is registered in _prepack_in_flight until its
+    process finishes, so requests for it briefly wait for the disk cache
+    instead of processing it a second time in this process.
+    """
+    submitted = {}  # {path: source_key}
+    for image_path in image_paths:
+        source = stat_source_image(image_path)
+        # Several paths (symlinks) to one file are processed once
+        if source is not None and source[0] not in _prepack_in_flight:
+            submitted[image_path] = source[0]
+            _prepack_in_flight[source[0]] = threading.Event()
+    if not submitted:
+        return  # Every image disappeared since the scan
+
+    workers = min(PREPACK_PROCESSES, len(submitted))
+    log_message(f"Prepacking {len(submitted)} images with {workers} processes")
+    try:
+        # spawn: forking a process that is already running threads is unsafe
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_prepack_in_subprocess, path): path for path in submitted}
+            for future in as_completed(futures):
+                image_path = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    log_message(f"Prepack failed for {image_path}: {e}")
+                _prepack_in_flight.pop(submitted[image_path]).set()
+                prepack_pending_images()
+    finally:
+        # Release any waiters left behind if the pool itself failed
+        for source_key in submitted.values():
+            done = _prepack_in_flight.pop(source_key, None)
+            if done is not None:
+                done.set()
+
+
+def prepack_all_images():
+    """
+    Process every gallery image that is not in the disk cache yet.
+
+    A backlog of several images (first start, or a batch of uploads) is
+    spread over PREPACK_PROCESSES worker processes, since processing is
+    CPU-bound and largely holds the GIL. After each image, the devices'
+    pending images are checked again, so a rotation advance during a long
+    first pass is still handled before the rest of the gallery.
+    """
+    missing = _find_unpacked_images()
+
+    if len(missing) > 1 and PREPACK_PROCESSES > 1:
+        _prepack_in_processes(missing)
+        return
+
+    for image_path in missing:
+        try:
+            processed = ensure_packed_cache(image_path)
+        except Exception as e:
+            log_message(f"Prepack failed for {image_path}: {e}")
+            continue
+        if processed:
+            prepack_pending_images()
 
 
-def display_image(uri, w=None, h=None):
-    """Fetch and process an image from a URL."""
-    print(uri)
+def _prepack_worker():
+    """Background loop that keeps pending images processed, then the rest of the gallery."""
     try:
-        response = requests.get(uri, timeout=5.0, headers=headers)
+        warm_up_dither_kernels()
+    except Exception as e:
+        log_message(f"Dither kernel warm-up failed: {e}")
+    while True:
+        # Any error ends only this pass; an escaping exception would stop
+        # prepacking for the life of the process
+        try:
+            prepack_pending_images()
+            prepack_all_images()
+        except Exception as e:
+            log_message(f"Prepack pass failed: {e}")
+        time.sleep(PREPACK_INTERVAL_SECONDS)
+
+
+def start_prepack_worker():
+    """Start the background prepack thread (daemon, so it never blocks exit)."""
+    thread = threading.Thread(target=_prepack_worker, name="prepack", daemon=True)
+    thread.start()
+    return thread
+
+
+def display_image(uri):
+    """Fetch an image from a URL and return it as a resized JPEG blob.
+
+    Returns:
+        bytes | None: JPEG data, or None if the fetch or decode failed
+    """
+    log_message(f"Fetching front page {uri}")
+    try:
+        # Streamed so the status and headers are checked before the body is
+        # downloaded; a rejected response is closed without reading it
+        response = http_session.get(uri, timeout=5.0, stream=True)
     except (requests.exceptions.ConnectionError,
             requests.exceptions.TooManyRedirects,
             requests.exceptions.ChunkedEncodingError,
             requests.exceptions.ReadTimeout) as e:
-        print(f"requests.get({uri}) generated exception:\n{e}")
-        return False
-
-    if response.status_code != 200:
-        print(f"status code = {response.status_code}")
-        return False
+        log_message(f"http_session.get({uri}) generated exception:\n{e}")
+        return None
 
-    if response.encoding or response.content.isascii():
-        print(f"{uri} returned ascii text and not an image")
-        return False
+    with response:
+        if response.status_code != 200:
+            log_message(f"status code = {response.status_code}")
+            return None
 
-    try:
-        img = wand.image.Image(file=BytesIO(response.content))
-    except Exception as e:
-        print(f"wand.image.Image(file=BytesIO(response.content)) "
-              f"generated exception from {uri} {e}")
-        return False
+        content_type = response.headers.get('Content-Type', '').lower()
+        if content_type and not content_type.startswith('image/'):
+            log_message(f"{uri} returned {content_type} and not an image")
+            return None
 
-    img.transform(resize='825x1600>')
+        # Check the JPEG magic bytes before downloading the rest, which also
+        # catches misconfigured origins (gzip/deflate transfer encodings are decoded).
+        # peek() leaves them in the buffer, so Image.open still reads the stream.
+        response.raw.decode_content = True
+        body = io.BufferedReader(response.raw)
+        try:
+            if body.peek(len(JPEG_MAGIC))[:len(JPEG_MAGIC)] != JPEG_MAGIC:
+                log_message("format is not JPEG")
+                return None
+            img = Image.open(body)
+        except Exception as e:
+            log_message(f"Image.open() generated exception from {uri} {e}")
+            return None
 
-    if img.format == 'JPEG':
-        img.save(filename="fp.jpg")
-        img.close()
-    else:
-        print("format is not JPEG")
-        return False
+    with img:
+        if img.format != 'JPEG':
+            log_message("format is not JPEG")
+            return None
+        # Shrink-only fit inside 825x1600, keeping the aspect ratio. thumbnail()
+        # lets libjpeg downscale while decoding, so the EXIF orientation is
+        # applied afterwards, with the box swapped for 90-degree orientations
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        img.thumbnail((1600, 825) if orientation in (5, 6, 7, 8) else (825, 1600),
+                      Image.Resampling.LANCZOS)
+        if orientation != 1:
+            img = ImageOps.exif_transpose(img)
+        buf = BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=85, optimize=True, progressive=True)
+        return buf.getvalue()
 
 
 @app.route("/hash")
@@ -955,20 +2079,25 @@ def image_hash():
     g.device_id = device_id
     log_message("Hash request", device_id=device_id)
 
-    image_path = get_pending_image_path(device_id)
-    if not image_path:
+    pending = get_pending_image(device_id)
+    if not pending:
         log_message("Hash request: no pending image", device_id=device_id)
         return "No image", 404
+    image_path, source = pending
 
     try:
-        _, hash_value = get_cached_image_data(image_path)
+        hash_value = get_cached_image_hash(image_path, source)
         if hash_value is None:
             return "No image", 404
         log_message(
             f"Hash response: next_image={os.path.basename(image_path)} hash={hash_value}",
             device_id=device_id,
         )
-        return hash_value
+        response = Response(hash_value, mimetype='text/plain')
+        response.set_etag(hash_value)
+        response.headers['Cache-Control'] = 'no-cache'
+        # If-None-Match with the hash the device already has -> empty 304
+        return response.make_conditional(request)
     except Exception as e:
         log_message(f"Error getting image hash: {e}", device_id=device_id)
         return f"Error: {e}", 500
@@ -1010,7 +2139,7 @@ def device_config():
 def schedule_editor():
     """Small web UI for editing schedule overrides."""
     target = normalize_schedule_target(request.args.get('target'))
-    message = request.args.get('message', '')
+    message = pop_flash(request.args.get('flash')) or request.args.get('message', '')
     error = request.args.get('error', '')
     return render_schedule_editor(target, message=message, error=error)
 
@@ -1028,9 +2157,7 @@ def schedule_save():
 
     path = get_schedule_config_path(target)
     save_schedule_config(path, config)
-    if redirect_to == '/':
-        return redirect(f"/?message={quote_plus('Schedule override saved')}")
-    return redirect(f"/schedule?target={target}&message={quote_plus('Schedule override saved')}")
+    return redirect_with_flash(redirect_to, target, 'Schedule override saved')
 
 
 @app.route("/schedule/clear", methods=["POST"])
@@ -1041,9 +2168,7 @@ def schedule_clear():
     path = get_schedule_config_path(target)
     deleted = delete_schedule_config(path)
     message = "Schedule override cleared" if deleted else "No override file existed for this target"
-    if redirect_to == '/':
-        return redirect(f"/?message={quote_plus(message)}")
-    return redirect(f"/schedule?target={target}&message={quote_plus(message)}")
+    return redirect_with_flash(redirect_to, target, message)
 
 
 @app.route("/image_packed")
@@ -1069,33 +2194,66 @@ def image_packed():
     log_message("Image request", device_id=device_id)
 
     # Resolve the next image without advancing so /hash and /image_packed stay in sync.
-    image_path = get_pending_image_path(device_id)
-    if not image_path:
+    pending = get_pending_image(device_id)
+    if not pending:
         return "No images available", 404
+    image_path, source = pending
 
     try:
-        packed_data, image_hash = get_cached_image_data(image_path)
-        if packed_data is None:
-            return "Failed to process image", 500
+        # Serve a gzip-encoded copy when the client accepts it: fewer bytes on
+        # the wire means less radio-on time for battery-powered devices.
+        # The ETag is the content hash, distinct per encoding.
+        use_gzip = request.accept_encodings['gzip'] > 0
+        response = None
+        entry = None
+        if use_gzip:
+            entry = get_cached_image_entry(image_path, source)
+        else:
+            # The hash comes from memory or the cache sidecar, so the disk cache
+            # file is sent without loading its 960KB into Python
+            image_hash = get_cached_image_hash(image_path, source)
+            if image_hash is not None:
+                response = send_packed_cache_file(source, image_hash)
+            if response is None:
+                entry = get_cached_image_entry(image_path, source)
+
+        if response is None:
+            if entry is None:
+                return "Failed to process image", 500
+            image_hash = entry['hash']
+
+        headers = {
+            'Content-Disposition': 'attachment; filename=image.bin',
+            'X-Image-Hash': image_hash,
+            'X-Image-Name': os.path.basename(image_path),
+            'X-Device-ID': device_id,
+            'Vary': 'Accept-Encoding',
+        }
 
-        image_name = os.path.basename(image_path)
-        _rotator.mark_image_served(device_id)
+        if response is None:
+            if use_gzip:
+                body = get_packed_gzip(entry)
+                etag = f"{image_hash}-gzip"
+                headers['Content-Encoding'] = 'gzip'
+            else:
+                body = entry['data']
+                etag = image_hash
+            response = Response(body, mimetype='application/octet-stream', headers=headers)
+            response.set_etag(etag)
+            response = response.make_conditional(request)
+        else:
+            response.headers.update(headers)
+
+        # A 304 means the client already holds this image; a 206 is only part of it
+        if response.status_code in (200, 304):
+            _rotator.mark_image_served(device_id)
         log_message(
-            f"Image response: image={image_name} hash={image_hash} bytes={len(packed_data)}",
+            f"Image response: image={headers['X-Image-Name']} hash={image_hash} "
+            f"status={response.status_code} bytes={response.content_length or 0}"
+            f"{' (gzip)' if 'Content-Encoding' in headers else ''}",
             device_id=device_id,
         )
-
-        return Response(
-            packed_data,
-            mimetype='application/octet-stream',
-            headers={
-                'Content-Length': str(len(packed_data)),
-                'Content-Disposition': 'attachment; filename=image.bin',
-                'X-Image-Hash': image_hash,
-                'X-Image-Name': image_name,
-                'X-Device-ID': device_id
-            }
-        )
+        return response
     except Exception as e:
         log_message(f"Error processing image: {e}", device_id=device_id)
         return f"Error: {e}", 500
@@ -1104,16 +2262,66 @@ def image_packed():
 @app.route("/image")
 def image():
     """Serve a transformed JPEG image (for preview/testing)."""
-    if not os.path.exists("image.jpg"):
+    global _preview_cache
+
+    if not PIL_AVAILABLE:
+        return "PIL not available", 500
+
+    source_sig = stat_source_image("image.jpg")
+    if source_sig is None:
         return "image.jpg not found", 404
 
-    with wand.image.Image(filename='image.jpg') as img:
-        img.rotate(90)
-        img.transform(resize='825x1600^')
-        img.crop(width=825, height=1600, gravity='center')
-        img.save(filename="transformed_image.jpg")
+    cache = _preview_cache
+    if cache['sig'] == source_sig:
+        blob = cache['blob']
+    else:
+        with Image.open('image.jpg') as img:
+            # Quarter turn clockwise, then scale to cover 825x1600 and crop the center
+            img = img.convert("RGB").transpose(Image.Transpose.ROTATE_270)
+            img = ImageOps.fit(img, (825, 1600), method=Image.Resampling.LANCZOS)
+            buf = BytesIO()
+            img.save(buf, format="JPEG", quality=90)
+            blob = buf.getvalue()
+        _preview_cache = {'sig': source_sig, 'blob': blob}
+
+    return send_file(BytesIO(blob), mimetype="image/jpeg")
+
+
+def fetch_random_frontpage():
+    """Fetch and resize a random front page; returns the JPEG blob or None."""
+    partial_url = random.choice(urls)
+    return display_image("https://www.frontpages.com" + partial_url)
+
 
-    return send_file("transformed_image.jpg", mimetype="image/jpg")
+def _frontpage_prefetcher():
+    """Background loop that keeps _frontpage_queue filled with resized front pages."""
+    while True:
+        blob = fetch_random_frontpage()
+        if blob is None:
+            time.sleep(FRONTPAGE_RETRY_SECONDS)
+            continue
+        _frontpage_queue.put((time.monotonic(), blob))  # Blocks while the queue is full
+
+
+def start_frontpage_prefetcher():
+    """Start the front page prefetch thread once (daemon, so it never blocks exit)."""
+    global _frontpage_prefetch_thread
+    with _frontpage_prefetch_lock:
+        if _frontpage_prefetch_thread is None:
+            _frontpage_prefetch_thread = threading.Thread(
+                target=_frontpage_prefetcher, name="frontpage-prefetch", daemon=True)
+            _frontpage_prefetch_thread.start()
+
+
+def get_prefetched_frontpage() -> bytes | None:
+    """Pop a prefetched front page that is still fresh, or None if none is ready."""
+    while True:
+        try:
+            fetched_at, blob = _frontpage_queue.get_nowait()
+        except queue.Empty:
+            return None
+        if time.monotonic() - fetched_at <= FRONTPAGE_MAX_AGE_SECONDS:
+            return blob
 
 
 @app.route("/imagejpg")
@@ -1122,11 +2330,16 @@ def imagejpg():
     if not urls:
         return "No URLs configured", 404
 
-    partial_url = random.choice(urls)
-    f = display_image("https://www.frontpages.com" + partial_url, 800, 1200)
-    if f is False:
+    if not PIL_AVAILABLE:
+        return "PIL not available", 500
+
+    # Serve a prefetched page when one is ready; the first request (or one
+    # that drains the queue) fetches on the request thread as before
+    start_frontpage_prefetcher()
+    blob = get_prefetched_frontpage() or fetch_random_frontpage()
+    if blob is None:
         return "Failed to fetch image", 500
-    return send_file("fp.jpg", mimetype="image/jpg")
+    return send_file(BytesIO(blob), mimetype="image/jpeg")
 
 
 @app.route("/current")
@@ -1188,10 +2401,6 @@ def current():
 def index():
     """Show available endpoints and multi-device status."""
     all_devices = _rotator.get_all_devices()
-    message = request.args.get('message', '')
-    error = request.args.get('error', '')
-    message_html = f'<div class="message success">{escape(message)}</div>' if message else ''
-    error_html = f'<div class="message error">{escape(error)}</div>' if error else ''
     schedule_cards = [
         render_schedule_form_card(GLOBAL_SCHEDULE_TARGET, redirect_to="/"),
         render_schedule_form_card(DEFAULT_DEVICE_ID, redirect_to="/"),
@@ -1199,19 +2408,16 @@ def index():
     for dev_id in all_devices:
         schedule_cards.append(render_schedule_form_card(dev_id, redirect_to="/"))
 
-    # Build device status table
-    device_rows = ""
+    # Build device status rows
+    devices = []
     for dev_id in all_devices:
         status = _rotator.get_status(dev_id)
         current_path = get_current_image_path(dev_id)
-        current_name = os.path.basename(current_path) if current_path else "None"
         batt = _battery_status.get(dev_id)
+        battery_color = None
         if batt:
             v = batt['voltage']
-            color = '#c00' if v < 3.3 else '#c90' if v < 3.7 else '#090'
-            batt_display = f'<span style="color:{color};font-weight:bold">{v:.2f}V</span><br><small>{batt["timestamp"]}</small>'
-        else:
-            batt_display = '<span style="color:#999">N/A</span>'
+            battery_color = '#c00' if v < 3.3 else '#c90' if v < 3.7 else '#090'
         schedule_config, config_source = get_device_schedule_config(dev_id)
         if schedule_config:
             schedule_summary = (
@@ -1221,129 +2427,50 @@ def index():
             )
         else:
             schedule_summary = 'No override'
-        device_rows += f"""
-        <tr>
-            <td><code>{dev_id}</code></td>
-            <td><code>{current_name}</code></td>
-            <td>{status['total_images']}</td>
-            <td>{batt_display}</td>
-            <td><code>{escape(schedule_summary)}</code><br><small>{escape(config_source)}</small></td>
-            <td><code>{status['images_dir']}</code></td>
-            <td><a href="/schedule?target={escape(dev_id)}">Edit</a></td>
-        </tr>"""
-
-    if not device_rows:
-        device_rows = "<tr><td colspan='7'>No devices have connected yet</td></tr>"
-
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-      <meta name="viewport" content="width=device-width, initial-scale=1">
-      <title>E-Ink Image Server</title>
-      <style>
-        body {{ font-family: Arial, sans-serif; max-width: 1180px; margin: 32px auto; padding: 0 16px 48px; background: #f6f7f9; color: #222; }}
-        h1, h2 {{ margin-bottom: 0.4rem; }}
-        .card {{ background: white; border: 1px solid #ddd; border-radius: 8px; padding: 18px; margin-bottom: 16px; }}
-        .row {{ margin-bottom: 14px; }}
-        label {{ display: block; font-weight: bold; margin-bottom: 6px; }}
-        input[type="text"], input[type="number"] {{ width: 100%; box-sizing: border-box; padding: 10px; border: 1px solid #ccc; border-radius: 4px; }}
-        button {{ background: #0b67d0; color: white; border: none; padding: 10px 16px; border-radius: 4px; cursor: pointer; margin-right: 8px; }}
-        button.danger {{ background: #c43d31; }}
-        .message {{ padding: 12px 14px; border-radius: 6px; margin-bottom: 16px; }}
-        .success {{ background: #e7f6ea; border: 1px solid #9bd0a7; }}
-        .error {{ background: #fdecec; border: 1px solid #e2a4a4; }}
-        .hint {{ color: #555; font-size: 0.95em; }}
-        .schedule-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(320px, 1fr)); gap: 16px; align-items: start; }}
-        table {{ width: 100%; background: white; border-collapse: collapse; }}
-        th, td {{ border: 1px solid #d9d9d9; padding: 8px; vertical-align: top; text-align: left; }}
-        code, pre {{ background: #eef1f4; border-radius: 4px; }}
-        code {{ padding: 2px 5px; }}
-        pre {{ padding: 12px; overflow-x: auto; }}
-        ul {{ margin-top: 8px; }}
-      </style>
-    </head>
-    <body>
-    <h1>E-Ink Image Server (Multi-Device)</h1>
-    {message_html}
-    {error_html}
-    <h2>Endpoints</h2>
-    <ul>
-        <li><a href="/image_packed">/image_packed</a> - Packed binary for ESP32 (960KB, advances rotation)</li>
-        <li><a href="/hash">/hash</a> - Image hash for change detection (16 chars)</li>
-        <li><a href="/device_config">/device_config</a> - Current epoch time plus optional schedule overrides</li>
-        <li><a href="/schedule">/schedule</a> - Browser UI for editing schedule overrides</li>
-        <li><a href="/current">/current</a> - Current rotation status (JSON)</li>
-        <li><a href="/image">/image</a> - Transformed JPEG preview</li>
-        <li><a href="/imagejpg">/imagejpg</a> - Random front page image</li>
-    </ul>
-    <p><em>Endpoints accept <code>X-Device-MAC</code> header for device identification.</em></p>
-
-    <h2>Schedule Shortcuts</h2>
-    <ul>
-        <li><a href="/schedule?target=global">Edit global fallback schedule</a></li>
-        <li><a href="/schedule?target=default">Edit default device schedule</a></li>
-    </ul>
-
-    <h2>Schedule Editor</h2>
-    <div class="schedule-grid">
-    {''.join(schedule_cards)}
-    </div>
-
-    <h2>Device Status</h2>
-    <table border="1" cellpadding="8" cellspacing="0">
-        <tr>
-            <th>Device ID (MAC)</th>
-            <th>Current Image</th>
-            <th>Total Images</th>
-            <th>Battery</th>
-            <th>Effective Schedule</th>
-            <th>Images Directory</th>
-            <th>Schedule</th>
-        </tr>
-        {device_rows}
-    </table>
-
-    <h2>Configuration</h2>
-    <ul>
-        <li>Images directory: <code>{IMAGES_DIR}</code></li>
-        <li>HEIC support: {'Yes' if HEIC_SUPPORT else 'No'}</li>
-        <li>Fallback image: <code>{DEFAULT_IMAGE_PATH}</code></li>
-    </ul>
-
-    <h2>Directory Structure</h2>
-    <pre>
-images/
-├── default/          # Fallback for unknown devices
-│   ├── image1.jpg
-│   ├── image2.png
-│   └── device_config.json  # Optional default schedule override
-├── d0cf1326f7e8/     # Device-specific (MAC without separators)
-│   ├── photo.jpg
-│   └── device_config.json  # Optional per-device override
-└── aabbccddeeff/     # Another device
-    └── ...
-    </pre>
-    <p>Create a directory named after the device's MAC address (lowercase, no separators) to serve device-specific images.</p>
-    <p>Optional schedule overrides live in <code>device_config.json</code> and can set <code>active_start_hour</code>, <code>active_end_hour</code>, <code>timezone_offset_minutes</code>, and <code>refresh_interval_minutes</code>.</p>
-    </body>
-    </html>
-    """
+        devices.append({
+            'id': dev_id,
+            'current_name': os.path.basename(current_path) if current_path else "None",
+            'total_images': status['total_images'],
+            'battery': batt,
+            'battery_color': battery_color,
+            'schedule_summary': schedule_summary,
+            'config_source': config_source,
+            'images_dir': status['images_dir'],
+        })
 
+    return render_template(
+        'index.html',
+        message=pop_flash(request.args.get('flash')) or request.args.get('message', ''),
+        error=request.args.get('error', ''),
+        schedule_cards=schedule_cards,
+        devices=devices,
+        images_dir=IMAGES_DIR,
+        heic_support=HEIC_SUPPORT,
+        fallback_image=DEFAULT_IMAGE_PATH,
+    )
 
-if __name__ == "__main__":
-    logging.getLogger('werkzeug').disabled = True
+
+def print_startup_info():
+    """Print the server configuration and the device directories found."""
     print("Starting E-Ink Image Server (Multi-Device)...")
     print(f"PIL available: {PIL_AVAILABLE}")
+    if PIL_AVAILABLE:
+        # Pillow-SIMD releases carry a ".postN" suffix, e.g. 9.5.0.post1
+        simd_note = " (Pillow-SIMD)" if ".post" in PIL_VERSION else ""
+        print(f"Pillow version: {PIL_VERSION}{simd_note}")
+        print(f"libjpeg-turbo: {pil_features.check_feature('libjpeg_turbo')}")
     print(f"HEIC support: {HEIC_SUPPORT}")
+    print(f"libvips backend: {PYVIPS_AVAILABLE}")
+    print(f"Image hash: {HASH_ALGO}")
     print(f"Default image: {DEFAULT_IMAGE_PATH}")
     print(f"Images directory: {IMAGES_DIR}")
     print(f"Display size: {FRAME_WIDTH}x{FRAME_HEIGHT}")
 
     # Check for device directories
     if os.path.isdir(IMAGES_DIR):
-        subdirs = [d for d in os.listdir(IMAGES_DIR)
-                   if os.path.isdir(os.path.join(IMAGES_DIR, d))]
+        # DirEntry.is_dir() uses the d_type from the listing; only symlinks need a stat
+        with os.scandir(IMAGES_DIR) as entries:
+            subdirs = [entry.name for entry in entries if entry.is_dir()]
         if subdirs:
             print(f"Device directories found: {', '.join(subdirs)}")
         else:
@@ -1358,4 +2485,28 @@ if __name__ == "__main__":
     if known_devices:
         print(f"Known devices from state: {', '.join(known_devices)}")
 
-    app.run(debug=True, host='0.0.0.0', port=5000)
+
+def start_background_workers():
+    """
+    Prune the disk cache and start the prepack thread.
+
+    Call once in the serving process before it takes requests: from
+    __main__ for the Flask server, or from gunicorn.conf.py's
+    post_worker_init hook.
+    """
+    pruned = prune_packed_cache()
+    if pruned:
+        print(f"Pruned {pruned} stale packed cache files")
+
+    start_prepack_worker()
+
+
+if __name__ == "__main__":
+    logging.getLogger('werkzeug').disabled = True
+    print_startup_info()
+    start_background_workers()
+
+    # Threaded so /hash polls are not queued behind an image being processed.
+    # No debug reloader: it would run a second copy of the background workers.
+    # For a production server, see gunicorn.conf.py.
+    app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
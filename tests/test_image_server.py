@@ -0,0 +1,278 @@
+"""Tests for the image server's packing pipeline, disk cache and HTTP caching."""
+
+import errno
+import gzip
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_server
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """The server module pointed at a throwaway gallery, state file and disk cache."""
+    gallery = tmp_path / "images" / image_server.DEFAULT_DEVICE_ID
+    gallery.mkdir(parents=True)
+    for name, color in (("a.jpg", (200, 40, 40)), ("b.jpg", (40, 40, 200))):
+        Image.new("RGB", (320, 240), color).save(gallery / name)
+
+    monkeypatch.setattr(image_server, "PACKED_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(image_server, "DEFAULT_IMAGE_PATH", str(tmp_path / "missing.jpg"))
+    monkeypatch.setattr(image_server, "_image_cache", OrderedDict())
+    monkeypatch.setattr(image_server, "_prepack_verified", set())
+    monkeypatch.setattr(image_server, "_rotator", image_server.ImageRotator(
+        str(tmp_path / "images"), str(tmp_path / "state.json")))
+    return image_server
+
+
+def _random_rgb(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def _unpack(packed):
+    """Split packed bytes into their high and low nibbles (pixel order)."""
+    packed = np.asarray(packed, dtype=np.uint8).ravel()
+    return np.stack((packed >> 4, packed & 0x0F), axis=1).ravel()
+
+
+def _rewrite_in_place(path, color):
+    """Overwrite an image through the same inode (like cp onto an existing file)."""
+    inode = os.stat(path).st_ino
+    Image.new("RGB", (321, 240), color).save(path)
+    assert os.stat(path).st_ino == inode
+
+
+# Source signature
+
+def test_in_place_rewrite_changes_hash(server, tmp_path):
+    client = server.app.test_client()
+    old_hash = client.get("/hash").get_data(as_text=True)
+    assert client.get("/image_packed").status_code == 200  # Loads the in-memory cache
+    client.get("/image_packed")  # Back to a.jpg
+
+    _rewrite_in_place(tmp_path / "images" / server.DEFAULT_DEVICE_ID / "a.jpg", (40, 200, 40))
+    new_hash = client.get("/hash").get_data(as_text=True)
+
+    assert new_hash != old_hash
+    response = client.get("/image_packed")
+    assert response.headers["X-Image-Hash"] == new_hash
+    assert server.hash_packed_data(response.data) == new_hash
+
+
+# Disk cache
+
+def test_packed_cache_round_trip(server):
+    key, sig = (1, 2), (3, 4)
+    server.save_packed_cache(key, sig, b"\x11" * 8, "0123456789abcdef", "a.jpg")
+
+    assert server.load_packed_cache(key, sig) == (b"\x11" * 8, "0123456789abcdef")
+    assert not [name for name in os.listdir(server.PACKED_CACHE_DIR) if name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("change", ["sig", "version", "dither", "hash_algo", "size"])
+def test_packed_cache_rejects_stale_sidecar(server, monkeypatch, change):
+    key, sig = (1, 2), (3, 4)
+    server.save_packed_cache(key, sig, b"\x11" * 8, "0123456789abcdef", "a.jpg")
+
+    if change == "sig":
+        sig = (3, 5)
+    elif change == "version":
+        monkeypatch.setattr(server, "PACKED_CACHE_VERSION", server.PACKED_CACHE_VERSION + 1)
+    elif change == "dither":
+        monkeypatch.setattr(server, "DITHER_MODE", "ordered")
+    elif change == "hash_algo":
+        monkeypatch.setattr(server, "HASH_ALGO", "md5")
+    else:
+        bin_path, _ = server.get_packed_cache_paths(key)
+        with open(bin_path, "wb") as f:
+            f.write(b"\x11" * 4)
+
+    assert server.load_packed_cache(key, sig) is None
+
+
+def test_prune_keeps_only_live_entries(server, tmp_path):
+    source = tmp_path / "images" / server.DEFAULT_DEVICE_ID / "a.jpg"
+    key, sig = server.stat_source_image(str(source))
+    server.save_packed_cache(key, sig, b"\x11" * 8, "0123456789abcdef", str(source))
+    server.save_packed_cache((9, 9), (1, 1), b"\x22" * 8, "fedcba9876543210", str(tmp_path / "gone.jpg"))
+    (tmp_path / "cache" / "leftover.tmp").write_bytes(b"")
+
+    assert server.prune_packed_cache() == 3
+    assert sorted(os.listdir(server.PACKED_CACHE_DIR)) == sorted(
+        os.path.basename(path) for path in server.get_packed_cache_paths(key))
+
+
+# /hash and /image_packed
+
+def test_image_packed_etag_and_not_modified(server):
+    client = server.app.test_client()
+    image_hash = client.get("/hash").get_data(as_text=True)
+
+    response = client.get("/image_packed")
+    assert response.status_code == 200
+    assert len(response.data) == server.BUFFER_SIZE
+    assert response.headers["X-Image-Hash"] == image_hash
+    assert response.get_etag() == (image_hash, False)
+
+    # The first image was marked served, so /hash has moved on to the next one
+    next_hash = client.get("/hash").get_data(as_text=True)
+    assert next_hash != image_hash
+
+    response = client.get("/image_packed", headers={"If-None-Match": f'"{next_hash}"'})
+    assert response.status_code == 304
+    assert client.get("/hash").get_data(as_text=True) == image_hash
+
+
+def test_image_packed_gzip(server):
+    client = server.app.test_client()
+    plain = client.get("/image_packed", headers={"Accept-Encoding": "identity"})
+    # The identity response doesn't make a gzip copy
+    assert server._image_cache
+    assert all(entry['gzip'] is None for entry in server._image_cache.values())
+    # Serve the second image so the rotation is back on the first
+    client.get("/image_packed")
+    response = client.get("/image_packed", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.get_etag() == (f"{plain.headers['X-Image-Hash']}-gzip", False)
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    assert gzip.decompress(response.data) == plain.data
+
+
+def test_image_packed_range_does_not_advance_rotation(server):
+    client = server.app.test_client()
+    image_hash = client.get("/hash").get_data(as_text=True)
+
+    response = client.get("/image_packed", headers={"Range": "bytes=0-99"})
+
+    assert response.status_code == 206
+    assert len(response.data) == 100
+    assert client.get("/hash").get_data(as_text=True) == image_hash
+
+
+def test_image_packed_never_sends_stale_cache_file(server, tmp_path, monkeypatch):
+    client = server.app.test_client()
+    client.get("/image_packed")  # a.jpg is now in the disk cache
+    client.get("/image_packed")  # Back to a.jpg
+
+    def disk_full(path, data):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(server, "_replace_atomically", disk_full)
+    _rewrite_in_place(tmp_path / "images" / server.DEFAULT_DEVICE_ID / "a.jpg", (40, 200, 40))
+    response = client.get("/image_packed")
+
+    assert response.status_code == 200
+    assert server.hash_packed_data(response.data) == response.headers["X-Image-Hash"]
+
+
+def test_hash_not_modified(server):
+    client = server.app.test_client()
+    image_hash = client.get("/hash").get_data(as_text=True)
+
+    response = client.get("/hash", headers={"If-None-Match": f'"{image_hash}"'})
+
+    assert response.status_code == 304
+
+
+# Directory listings
+
+def test_listing_sees_file_added_in_same_mtime_tick(server, tmp_path):
+    gallery = tmp_path / "images" / server.DEFAULT_DEVICE_ID
+    assert server._rotator._list_images(str(gallery)) == ["a.jpg", "b.jpg"]
+
+    # Add a file without the directory mtime changing (coarse timestamps)
+    st = os.stat(gallery)
+    Image.new("RGB", (8, 8)).save(gallery / "c.jpg")
+    os.utime(gallery, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert server._rotator._list_images(str(gallery)) == ["a.jpg", "b.jpg", "c.jpg"]
+
+
+# Flash messages
+
+def test_flash_is_shown_once(server):
+    token = server.stash_flash("Schedule override saved")
+
+    assert server.pop_flash(token) == "Schedule override saved"
+    assert server.pop_flash(token) == ""
+    assert server.pop_flash(None) == ""
+
+
+def test_flash_expires(server, monkeypatch):
+    token = server.stash_flash("Schedule override saved")
+    monkeypatch.setattr(server, "FLASH_MAX_AGE_SECONDS", -1)
+
+    assert server.pop_flash(token) == ""
+
+
+def test_schedule_save_redirects_with_flash(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "get_schedule_config_path",
+                        lambda target: str(tmp_path / f"{target}.json"))
+    client = server.app.test_client()
+
+    response = client.post("/schedule/save", data={
+        "target": server.DEFAULT_DEVICE_ID,
+        "refresh_interval_minutes": "20",
+        "active_start_hour": "6",
+        "active_end_hour": "22",
+        "timezone_offset_minutes": "0",
+    })
+
+    assert response.status_code == 302
+    location = response.headers["Location"]
+    assert "flash=" in location
+    assert "Schedule override saved" in client.get(location).get_data(as_text=True)
+    assert "Schedule override saved" not in client.get(location).get_data(as_text=True)
+    assert json.loads((tmp_path / "default.json").read_text())["refresh_interval_minutes"] == 20
+
+
+# Dithering and packing
+
+@pytest.mark.skipif(not image_server.NUMBA_AVAILABLE, reason="numba not installed")
+def test_ordered_dither_emits_hardware_codes():
+    rgb = _random_rgb(64, 96)
+    contrast_pivot = float(int(image_server.mean_luma(rgb, image_server.DEFAULT_BRIGHTNESS) + 0.5))
+    tone_lut = image_server.build_tone_lut(image_server.DEFAULT_BRIGHTNESS,
+                                           image_server.DEFAULT_CONTRAST, contrast_pivot)
+
+    packed = image_server.ordered_dither_pack(
+        rgb, tone_lut, image_server.DEFAULT_SATURATION,
+        image_server.BAYER_8X8, image_server.ORDERED_DITHER_STRENGTH,
+        image_server.NEAREST_LUT, image_server.HARDWARE_CODES_ARRAY,
+        image_server.SRGB_TO_LINEAR, image_server.LINEAR_TO_SRGB)
+
+    assert packed.size == 64 * 96 // 2
+    assert set(np.unique(_unpack(packed))) <= set(image_server.HARDWARE_CODES)
+
+
+@pytest.mark.parametrize("use_numba", [True, False], ids=["numba", "pil"])
+def test_process_image_to_packed_fills_the_frame(tmp_path, monkeypatch, use_numba):
+    if use_numba and not image_server.NUMBA_AVAILABLE:
+        pytest.skip("numba not installed")
+    monkeypatch.setattr(image_server, "NUMBA_AVAILABLE", use_numba)
+    path = tmp_path / "photo.png"
+    Image.fromarray(_random_rgb(300, 400)).save(path)
+
+    packed = image_server.process_image_to_packed(str(path))
+
+    assert len(packed) == image_server.BUFFER_SIZE
+    assert set(np.unique(_unpack(np.frombuffer(packed, dtype=np.uint8)))) <= set(image_server.HARDWARE_CODES)
+
+
+def test_device_dir_created_in_same_mtime_tick(server, tmp_path):
+    images = tmp_path / "images"
+    assert server._rotator._get_device_dir("aabbccddeeff") == str(images / server.DEFAULT_DEVICE_ID)
+
+    st = os.stat(images)
+    (images / "aabbccddeeff").mkdir()
+    os.utime(images, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert server._rotator._get_device_dir("aabbccddeeff") == str(images / "aabbccddeeff")